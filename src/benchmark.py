@@ -0,0 +1,206 @@
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from heuristic import Heuristic, Rectangle
+from idbs import IDBS
+from instances import DATA_DIR, find_instance_files, read_rectangles_from_file
+from portfolio import create_portfolio
+from tabu_search import TabuSearchSolver
+
+LEVELS = ("heuristic", "tabu", "idbs")
+# Rectangle counts of the synthetic instances
+SYNTHETIC_SIZES = (50, 100, 200)
+SYNTHETIC_BIN_WIDTH = 200
+# Sequences placed per repetition of the heuristic benchmark
+HEURISTIC_SEQUENCES = 50
+# Iterations of a single tabu search
+TABU_ITERATIONS = 2
+# Time limit of a single IDBS run in seconds
+IDBS_TIME_LIMIT = 10
+# Relative increase in the median time that counts as a regression
+REGRESSION_THRESHOLD = 0.1
+
+
+def synthetic_instance(rectangle_count, bin_width, seed):
+    """Cuts a bin_width x bin_width strip into rectangles with guillotine cuts, so the optimum height is known.
+    The largest piece is cut into two at a random point of its longer side until there are enough pieces."""
+    rng = random.Random(seed)
+    pieces = [(bin_width, bin_width)]
+    while len(pieces) < rectangle_count:
+        pieces.sort(key=lambda x: x[0] * x[1])
+        width, height = pieces.pop()
+        if width >= height:
+            cut = rng.randint(1, width - 1)
+            pieces += [(cut, height), (width - cut, height)]
+        else:
+            cut = rng.randint(1, height - 1)
+            pieces += [(width, cut), (width, height - cut)]
+    rng.shuffle(pieces)
+    return [Rectangle(width, height, k) for k, (width, height) in enumerate(pieces)], bin_width, bin_width
+
+
+def load_instances(patterns):
+    """Returns the data files and the synthetic instances whose names match one of the patterns."""
+    instances = {}
+    for path_to_file in find_instance_files(DATA_DIR):
+        instances[os.path.basename(path_to_file)] = lambda path=path_to_file: read_rectangles_from_file(path)
+    for size in SYNTHETIC_SIZES:
+        instances[f"S{size}"] = lambda size=size: synthetic_instance(size, SYNTHETIC_BIN_WIDTH, size)
+    return {
+        name: load() for name, load in instances.items() if any(fnmatch.fnmatch(name, p) for p in patterns)
+    }
+
+
+def counting_class(heuristic_class, counter):
+    """Subclass of the heuristic class which counts its runs in the counter list."""
+
+    class CountingHeuristic(heuristic_class):
+        def run(self, *args, **kwargs):
+            counter[0] += 1
+            return super().run(*args, **kwargs)
+
+    return CountingHeuristic
+
+
+def bench_heuristic(rectangles, bin_width, bin_height, seed):
+    """Places shuffled sequences of the rectangles at the optimum height with the largest spread value."""
+    rng = random.Random(seed)
+    sequences = [rng.sample(rectangles, len(rectangles)) for _ in range(HEURISTIC_SEQUENCES)]
+    heuristic = Heuristic()
+    successes = 0
+    t0 = time.perf_counter()
+    for sequence in sequences:
+        heuristic.setup(sequence, bin_width, bin_height, bin_height)
+        if heuristic.run():
+            successes += 1
+    run_time = time.perf_counter() - t0
+    return {"time": run_time, "runs": len(sequences), "successes": successes}
+
+
+def bench_tabu(rectangles, bin_width, bin_height, seed):
+    """Runs a tabu search with a fixed number of iterations at the optimum height."""
+    solver = TabuSearchSolver(10, 3, seed=seed)
+    runs = [0]
+    solver.heuristic_class = counting_class(solver.heuristic_class, runs)
+    t0 = time.perf_counter()
+    success = solver.run(rectangles, bin_width, bin_height, TABU_ITERATIONS)
+    run_time = time.perf_counter() - t0
+    solver.close()
+    return {"time": run_time, "runs": runs[0], "successes": int(success), "height": bin_height if success else None}
+
+
+def bench_idbs(rectangles, bin_width, bin_height, seed):
+    """Runs IDBS in this process with a single portfolio assignment."""
+    idbs = IDBS(IDBS_TIME_LIMIT, bin_width, bin_height)
+    runs = [0]
+    idbs.solver.heuristic_class = counting_class(idbs.solver.heuristic_class, runs)
+    return_queue = multiprocessing.Queue()
+    assignment = create_portfolio(1, 10, 3, seed)[0]
+    t0 = time.perf_counter()
+    idbs.run(rectangles, multiprocessing.Event(), multiprocessing.Event(), return_queue, assignment=assignment)
+    run_time = time.perf_counter() - t0
+    best_seq = return_queue.get()
+    return {"time": run_time, "runs": runs[0], "height": best_seq[1] if best_seq else None}
+
+
+BENCHMARKS = {"heuristic": bench_heuristic, "tabu": bench_tabu, "idbs": bench_idbs}
+
+
+def summarize(samples):
+    """Repetition statistics of the benchmark results. Runs, successes and heights are taken from the first
+    repetition since the seeds are the same for all of them."""
+    times = [sample["time"] for sample in samples]
+    median_time = statistics.median(times)
+    summary = {key: value for key, value in samples[0].items() if key != "time"}
+    summary.update(
+        {
+            "repeat": len(times),
+            "min_time": min(times),
+            "median_time": median_time,
+            "mean_time": statistics.mean(times),
+            "stdev_time": statistics.stdev(times) if len(times) > 1 else 0.0,
+            "runs_per_second": summary["runs"] / median_time if median_time else None,
+        }
+    )
+    return summary
+
+
+def run_benchmarks(levels, instances, repeat, warmup, seed):
+    """Runs each benchmark level on each instance. Returns the results keyed by level/instance."""
+    results = {}
+    for level in levels:
+        for name, (rectangles, bin_width, bin_height) in instances.items():
+            bench = BENCHMARKS[level]
+            for _ in range(warmup):
+                bench(rectangles, bin_width, bin_height, seed)
+            samples = [bench(rectangles, bin_width, bin_height, seed) for _ in range(repeat)]
+            results[f"{level}/{name}"] = summarize(samples)
+            print(f"{level}/{name}: {results[f'{level}/{name}']['median_time']:.3f}s", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the regressions of the results against the baseline results. A benchmark regresses if its median
+    time increases more than the threshold, it places fewer sequences or it finds a higher solution."""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        ratio = result["median_time"] / old["median_time"] if old["median_time"] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append(f"{key}: median time {old['median_time']:.3f}s -> {result['median_time']:.3f}s")
+        if result.get("successes", 0) < old.get("successes", 0):
+            regressions.append(f"{key}: successes {old['successes']} -> {result['successes']}")
+        if old.get("height") is not None and (result.get("height") is None or result["height"] > old["height"]):
+            regressions.append(f"{key}: height {old['height']} -> {result.get('height')}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the heuristic, the tabu search and IDBS.")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--instances", nargs="+", default=["*"], help="Name patterns of the instances")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File to write the results as JSON, stdout if not given")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the results against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    instances = load_instances(args.instances)
+    results = run_benchmarks(args.levels, instances, args.repeat, args.warmup, args.seed)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
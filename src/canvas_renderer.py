@@ -0,0 +1,80 @@
+FILL = "#a8dadc"
+ROTATED_FILL = "#f4a261"
+OUTLINE = "black"
+# Rectangles smaller than this in pixels are drawn without an outline, an outline would cover all of them
+MIN_OUTLINE_SIZE = 3
+# Rectangles smaller than this in pixels on both sides are not drawn at all
+MIN_DRAWN_SIZE = 1
+# Empty space around the bin as a ratio of its longer side
+MARGIN = 0.1
+TAG = "solution"
+
+
+class CanvasRenderer:
+    def __init__(self, canvas) -> None:
+        """Draws solutions on a Tk canvas as one rectangle item per placed rectangle. Items are created in
+        one batch without updating the canvas in between, so Tk redraws them once. Drawing another solution
+        of the same bin only moves the items of the rectangles whose positions changed."""
+        self.canvas = canvas
+        # Rectangle -> (canvas item, (x, y, rotate)) of the drawn solution
+        self.items = {}
+        self.layout = None
+
+    def clear(self):
+        """Deletes the drawn solution."""
+        self.canvas.delete(TAG)
+        self.items = {}
+        self.layout = None
+
+    def find_layout(self, bin_width, bin_height):
+        """Returns the scale and the canvas position of the bottom left corner of the bin which fit the bin in the
+        middle of the canvas."""
+        self.canvas.update_idletasks()
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        scale = min(canvas_width, canvas_height) / (max(bin_width, bin_height) * (1 + MARGIN))
+        left = (canvas_width - bin_width * scale) / 2
+        bottom = (canvas_height + bin_height * scale) / 2
+        return scale, left, bottom
+
+    def draw(self, placements, bin_width, bin_height, colour_rotated=False):
+        """Draws a list of (rectangle, bottom left position, rotate) placements in a bin_width x bin_height bin.
+        Rotated rectangles are filled with another colour if colour_rotated is set."""
+        layout = (bin_width, bin_height, colour_rotated)
+        if layout != self.layout:
+            self.clear()
+            self.layout = layout
+            self.scale, self.left, self.bottom = self.find_layout(bin_width, bin_height)
+        canvas = self.canvas
+        old_items = self.items
+        self.items = {}
+        for rectangle, (x, y), rotate in placements:
+            item, old_position = old_items.pop(rectangle, (None, None))
+            position = (x, y, rotate)
+            if item is not None and old_position == position:
+                self.items[rectangle] = (item, position)
+                continue
+            width, height = (rectangle.height, rectangle.width) if rotate else (rectangle.width, rectangle.height)
+            width *= self.scale
+            height *= self.scale
+            if width < MIN_DRAWN_SIZE and height < MIN_DRAWN_SIZE:
+                # Too small to see, only the old item is removed
+                if item is not None:
+                    canvas.delete(item)
+                continue
+            left = self.left + x * self.scale
+            top = self.bottom - y * self.scale - height
+            coords = (left, top, left + width, top + height)
+            fill = ROTATED_FILL if colour_rotated and rotate else FILL if colour_rotated else ""
+            outline = OUTLINE if width >= MIN_OUTLINE_SIZE and height >= MIN_OUTLINE_SIZE else ""
+            if outline == "" and fill == "":
+                fill = OUTLINE
+            if item is None:
+                item = canvas.create_rectangle(*coords, fill=fill, outline=outline, tags=TAG)
+            else:
+                canvas.coords(item, *coords)
+                canvas.itemconfigure(item, fill=fill, outline=outline)
+            self.items[rectangle] = (item, position)
+        # Rectangles which are not in the new solution
+        for item, _ in old_items.values():
+            canvas.delete(item)
@@ -0,0 +1,194 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from instances import find_instance_files, read_rectangle_count, read_rectangles_from_file
+from portfolio import create_portfolio
+from search_pool import SearchPool
+
+FORMATS = ("json", "csv", "gcode", "svg")
+
+
+def collect_instance_files(paths):
+    """Returns the instance files given by the paths. A directory gives the files directly inside it whose names
+    match the instance file pattern, a file is used whatever its name is."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += find_instance_files(path)
+        else:
+            files.append(path)
+    return files
+
+
+def largest_rectangle_count(files):
+    """Returns the largest rectangle count of the files. Unreadable files are skipped here and reported when
+    their instance is solved."""
+    counts = []
+    for path in files:
+        try:
+            counts.append(read_rectangle_count(path))
+        except (OSError, ValueError):
+            pass
+    return max(counts, default=0)
+
+
+def placement_rows(placements):
+    """Returns the placements as (id, x, y, width, height, rotated) rows with the placed width and height."""
+    rows = []
+    for rectangle, (x, y), rotate in placements:
+        width, height = (rectangle.height, rectangle.width) if rotate else (rectangle.width, rectangle.height)
+        rows.append((rectangle.id, x, y, width, height, rotate))
+    return rows
+
+
+def write_json(path, result):
+    with open(path, "w") as output:
+        json.dump(
+            dict(
+                {key: value for key, value in result.items() if key != "placements"},
+                placements=[
+                    dict(zip(("id", "x", "y", "width", "height", "rotated"), row))
+                    for row in placement_rows(result["placements"])
+                ],
+            ),
+            output,
+            indent=2,
+        )
+
+
+def write_csv(path, result):
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(("id", "x", "y", "width", "height", "rotated"))
+        writer.writerows(placement_rows(result["placements"]))
+
+
+def write_gcode(path, result):
+    # G-code planning is only needed for this format
+    import gcode
+
+    scale = gcode.paper_scale(result["bin_width"], result["height"])
+    with open(path, "w") as output:
+        gcode.write_gcode(
+            output,
+            gcode.plan_polylines(result["placements"]),
+            scale,
+            f"{gcode.DEF_SERVO_UP} S{gcode.DEF_UP_ANGLE}",
+            f"{gcode.DEF_SERVO_DOWN} S{gcode.DEF_DOWN_ANGLE}",
+            gcode.DEF_TRAVEL_SPEED,
+            gcode.DEF_DRAWING_SPEED,
+            gcode.DEF_DELAY,
+        )
+
+
+def write_svg(path, result):
+    """Writes the solution as an SVG image with the bottom of the strip at the bottom of the image."""
+    bin_width = result["bin_width"]
+    height = result["height"]
+    stroke_width = max(bin_width, height) / 500
+    with open(path, "w") as output:
+        output.write(
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {bin_width} {height}" '
+            f'width="{bin_width}" height="{height}">\n'
+        )
+        output.write(f'<g fill="none" stroke="black" stroke-width="{stroke_width:g}">\n')
+        for rectangle_id, x, y, width, rectangle_height, _ in placement_rows(result["placements"]):
+            output.write(
+                f'<rect id="r{rectangle_id}" x="{x}" y="{height - y - rectangle_height}" '
+                f'width="{width}" height="{rectangle_height}"/>\n'
+            )
+        output.write("</g>\n</svg>\n")
+
+
+WRITERS = {"json": write_json, "csv": write_csv, "gcode": write_gcode, "svg": write_svg}
+
+
+def solve_all(files, args):
+    """Solves the instance files one after another on one pool of search processes. Yields a result dict
+    for each file, the result has no placements if no solution is found and an error if the file can't be read.
+    Each file is read just before it is solved."""
+    pool = SearchPool(args.workers, largest_rectangle_count(files))
+    try:
+        for path in files:
+            try:
+                rectangles, bin_width, optimum_height = read_rectangles_from_file(path)
+            except (OSError, ValueError) as error:
+                yield {"instance": os.path.basename(path), "error": f"can't read instance file: {error}"}
+                continue
+            pool.add_instance(path, rectangles)
+            target_height = args.height if args.height is not None else optimum_height
+            portfolio = (
+                create_portfolio(pool.processes, args.tabu_seq_length, args.tabu_tenure) if args.portfolio else None
+            )
+            t0 = time.time()
+            best_seq = pool.run(
+                path,
+                bin_width,
+                target_height,
+                args.time_limit,
+                portfolio,
+                tabu_seq_length=args.tabu_seq_length,
+                tabu_tenure_multiplier=args.tabu_tenure,
+            )
+            # Each instance is solved once, so the processes don't need to keep its rectangles
+            pool.remove_instance(path)
+            result = {
+                "instance": os.path.basename(path),
+                "rectangles": len(rectangles),
+                "bin_width": bin_width,
+                "target_height": target_height,
+                "height": best_seq[1] if best_seq else None,
+                "time": round(time.time() - t0, 3),
+                "found_by": portfolio[best_seq[2]].describe() if best_seq and portfolio and best_seq[2] >= 0 else None,
+            }
+            if best_seq:
+                result["placements"] = list(best_seq[0].materialise(rectangles))
+            yield result
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solves strip packing instance files without the UI.")
+    parser.add_argument("paths", nargs="+", help="Instance files or directories of instance files")
+    parser.add_argument("--time-limit", type=float, default=100, help="Time limit of each instance in seconds")
+    parser.add_argument("--workers", type=int, default=max(multiprocessing.cpu_count() // 2, 1))
+    parser.add_argument("--tabu-seq-length", type=int, default=10)
+    parser.add_argument("--tabu-tenure", type=int, default=3)
+    parser.add_argument("--height", type=int, help="Target height, the optimum height of the file if not given")
+    parser.add_argument(
+        "--no-portfolio", dest="portfolio", action="store_false", help="Run the same search on all the workers"
+    )
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["json"], help="Solution file formats")
+    parser.add_argument("--output-dir", default=".", help="Directory to write the solution files into")
+    args = parser.parse_args()
+
+    files = collect_instance_files(args.paths)
+    if not files:
+        parser.error("no instance files found")
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = 0
+    for result in solve_all(files, args):
+        if "error" in result:
+            failed += 1
+            print(f"{result['instance']}: {result['error']}", file=sys.stderr)
+            continue
+        if "placements" not in result:
+            failed += 1
+            print(f"{result['instance']}: no solution in {result['time']}s", file=sys.stderr)
+            continue
+        name = os.path.join(args.output_dir, result["instance"])
+        for output_format in args.format:
+            WRITERS[output_format](f"{name}.{output_format}", result)
+        print(f"{result['instance']}: height {result['height']} (target {result['target_height']}) in {result['time']}s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
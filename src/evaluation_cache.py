@@ -0,0 +1,46 @@
+import hashlib
+import struct
+from collections import OrderedDict
+
+
+class EvaluationCache:
+    def __init__(self, max_size: int) -> None:
+        """Results of the heuristic runs keyed by the sequence and the bin parameters of the run.
+        When the cache is full the least recently used result is dropped."""
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(permutation: bytes, bin_width, bin_height, max_spread):
+        """Compact hash of a permutation of the rectangle ids and the bin parameters."""
+        digest = hashlib.blake2b(permutation, digest_size=16)
+        digest.update(struct.pack("<ddd", bin_width, bin_height, max_spread))
+        return digest.digest()
+
+    def get(self, key):
+        """Returns the (success, wasted space, pruned) result for the key or None if it is not in the cache."""
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, success, wasted_space, pruned):
+        """Stores the result of a run. Wasted space of a pruned run is the wasted space when it was pruned."""
+        self.results[key] = (success, wasted_space, pruned)
+        self.results.move_to_end(key)
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+    def clear(self):
+        """Removes all the results and resets the counters."""
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
@@ -0,0 +1,207 @@
+import math
+import time
+
+DEF_SERVO_UP = "M03"
+DEF_SERVO_DOWN = "M05"
+DEF_TRAVEL_SPEED = "2000"
+DEF_DRAWING_SPEED = "1000"
+DEF_UP_ANGLE = "30"
+DEF_DOWN_ANGLE = "60"
+DEF_DELAY = "0.2"
+
+A4_WIDTH = 21.0
+A4_HEIGHT = 29.7
+
+# Max passes of the 2-opt improvement on the stroke order
+TWO_OPT_PASSES = 50
+# Max seconds spent on the 2-opt improvement
+TWO_OPT_TIME_LIMIT = 5.0
+# Pen up and down commands are each followed by a delay before and after them
+DELAYS_PER_POLYLINE = 4
+
+
+def find_strokes(placements):
+    """Returns the lines to draw for a list of (rectangle, bottom left position, rotate) placements as
+    (x1, y1, x2, y2) tuples. Edges on the same horizontal or vertical line are merged where they touch or
+    overlap, so an edge shared by two rectangles or split between neighbors is drawn once as one line."""
+    # Intervals of the edges keyed by the line they are on
+    horizontal = {}
+    vertical = {}
+    for rectangle, (x, y), rotate in placements:
+        width, height = (rectangle.height, rectangle.width) if rotate else (rectangle.width, rectangle.height)
+        for line_y in (y, y + height):
+            horizontal.setdefault(line_y, []).append((x, x + width))
+        for line_x in (x, x + width):
+            vertical.setdefault(line_x, []).append((y, y + height))
+    strokes = []
+    for line_y, intervals in sorted(horizontal.items()):
+        for start, end in merge_intervals(intervals):
+            strokes.append((start, line_y, end, line_y))
+    for line_x, intervals in sorted(vertical.items()):
+        for start, end in merge_intervals(intervals):
+            strokes.append((line_x, start, line_x, end))
+    return strokes
+
+
+def merge_intervals(intervals):
+    """Returns the union of the intervals as sorted disjoint intervals."""
+    intervals.sort()
+    merged = [list(intervals[0])]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def travel(strokes, origin=(0, 0)):
+    """Pen up travel length of drawing the strokes in order, starting and ending at the origin."""
+    position = origin
+    length = 0.0
+    for x1, y1, x2, y2 in strokes:
+        length += math.dist(position, (x1, y1))
+        position = (x2, y2)
+    return length + math.dist(position, origin)
+
+
+def order_strokes(strokes, origin=(0, 0), passes=TWO_OPT_PASSES, time_limit=TWO_OPT_TIME_LIMIT):
+    """Orders and orients the strokes to shorten the pen up travel of a plot which starts and ends at the origin.
+    The order is built by going to the nearest stroke end each time, then improved with 2-opt moves, which
+    reverse a part of the order and the direction of each stroke in it."""
+    remaining = list(strokes)
+    ordered = []
+    position = origin
+    while remaining:
+        best = 0
+        best_distance = float("inf")
+        reverse = False
+        for k, (x1, y1, x2, y2) in enumerate(remaining):
+            distance = math.dist(position, (x1, y1))
+            if distance < best_distance:
+                best, best_distance, reverse = k, distance, False
+            distance = math.dist(position, (x2, y2))
+            if distance < best_distance:
+                best, best_distance, reverse = k, distance, True
+            if best_distance == 0:
+                break
+        x1, y1, x2, y2 = remaining[best]
+        # Swap with the last one so the removal doesn't shift the list
+        remaining[best] = remaining[-1]
+        remaining.pop()
+        stroke = (x2, y2, x1, y1) if reverse else (x1, y1, x2, y2)
+        ordered.append(stroke)
+        position = stroke[2:]
+    return two_opt(ordered, origin, passes, time_limit)
+
+
+def two_opt(strokes, origin=(0, 0), passes=TWO_OPT_PASSES, time_limit=TWO_OPT_TIME_LIMIT):
+    """Improves the stroke order by reversing the parts whose reversal shortens the travel, until no reversal
+    helps or the pass or time limit is reached. Travel inside a reversed part stays the same, so only the two
+    travels at its ends are compared."""
+    t0 = time.time()
+    count = len(strokes)
+    for _ in range(passes):
+        improved = False
+        for i in range(count):
+            # End of the previous stroke and start of the first stroke of the reversed part
+            previous_end = strokes[i - 1][2:] if i > 0 else origin
+            first_start = strokes[i][:2]
+            for j in range(i + 1, count):
+                last_end = strokes[j][2:]
+                next_start = strokes[j + 1][:2] if j + 1 < count else origin
+                delta = (
+                    math.dist(previous_end, last_end)
+                    + math.dist(first_start, next_start)
+                    - math.dist(previous_end, first_start)
+                    - math.dist(last_end, next_start)
+                )
+                if delta < -1e-9:
+                    strokes[i : j + 1] = [(x2, y2, x1, y1) for x1, y1, x2, y2 in reversed(strokes[i : j + 1])]
+                    first_start = strokes[i][:2]
+                    improved = True
+        if not improved or time.time() - t0 > time_limit:
+            break
+    return strokes
+
+
+def join_polylines(strokes):
+    """Joins the ordered strokes into polylines, a stroke continues the previous polyline if it starts where
+    the previous one ends, so the pen isn't raised between them. Returns the polylines as lists of points."""
+    polylines = []
+    for x1, y1, x2, y2 in strokes:
+        if polylines and polylines[-1][-1] == (x1, y1):
+            polylines[-1].append((x2, y2))
+        else:
+            polylines.append([(x1, y1), (x2, y2)])
+    return polylines
+
+
+def plan_polylines(placements):
+    """Returns the polylines which draw the placements with merged edges in an order with short pen up travel."""
+    return join_polylines(order_strokes(find_strokes(placements)))
+
+
+def paper_scale(bin_width, bin_height):
+    """Scale down factor which fits the solution on an A4 paper, 1 if it already fits."""
+    if bin_width > A4_WIDTH:
+        return (A4_WIDTH - 1) / bin_width
+    elif bin_height > A4_HEIGHT:
+        return (A4_HEIGHT - 1) / bin_height
+    return 1
+
+
+class PlotEstimate:
+    def __init__(self, polylines, scale, travel_speed, drawing_speed, delay, origin=(0, 0)) -> None:
+        """Lengths and the estimated time of plotting the polylines. Speeds are in units per minute like the feed
+        rates of G-code, delay is the seconds of a G4 dwell."""
+        self.polylines = len(polylines)
+        self.draw_length = 0.0
+        self.travel_length = 0.0
+        position = origin
+        for polyline in polylines:
+            self.travel_length += math.dist(position, polyline[0]) * scale
+            for start, end in zip(polyline, polyline[1:]):
+                self.draw_length += math.dist(start, end) * scale
+            position = polyline[-1]
+        self.travel_length += math.dist(position, origin) * scale
+        self.time = (
+            self.travel_length / travel_speed * 60
+            + self.draw_length / drawing_speed * 60
+            + self.polylines * DELAYS_PER_POLYLINE * delay
+        )
+
+    def __str__(self):
+        return (
+            f"{self.polylines} pen lifts, {self.draw_length:.1f} drawn, {self.travel_length:.1f} travelled, "
+            f"estimated plot time {self.time / 60:.1f} min"
+        )
+
+
+def write_gcode(file, polylines, scale, up_command, down_command, travel_speed, drawing_speed, delay):
+    """Writes the G-code drawing the polylines to an open file. The pen is lowered once for each polyline and
+    the plot ends at the origin."""
+    up_command = f"{up_command}\n"
+    down_command = f"{down_command}\n"
+    travel_speed = f"G1 F{travel_speed}\n"
+    drawing_speed = f"G1 F{drawing_speed}\n"
+    delay = f"G4 P{delay}\n"
+    # First raise the pen and give the settings
+    file.write(f"{up_command}\nG90\nG21\n")
+    for polyline in polylines:
+        x, y = polyline[0]
+        # Go to the start of the polyline with the pen up
+        file.write(travel_speed)
+        file.write(f"G1 X{x * scale:g} Y{y * scale:g}\n")
+        file.write(delay)
+        file.write(down_command)
+        file.write(delay)
+        file.write(drawing_speed)
+        for x, y in polyline[1:]:
+            file.write(f"G1 X{x * scale:g} Y{y * scale:g}\n")
+        file.write(delay)
+        file.write(up_command)
+        file.write(delay)
+    file.write(travel_speed)
+    # Go to origin at the end
+    file.write("G1 X0 Y0")
@@ -1,11 +1,61 @@
+import bisect
+from array import array
+from itertools import accumulate
+from operator import mul
+
 
 class Rectangle:
-    def __init__(self, width: int, height: int) -> None:
-        self.width = width
-        self.height = height
-        self.rotate = False
-        self.index = -1
-        self.bottom_left_pos = ()
+    __slots__ = ("width", "height", "id")
+
+    def __init__(self, width: int, height: int, id: int = -1) -> None:
+        """Size of a rectangle to place and its index in the instance. Rectangles are immutable and compared by
+        identity, so the same objects are shared by all the runs. Placements of a run are kept by the heuristic."""
+        object.__setattr__(self, "width", width)
+        object.__setattr__(self, "height", height)
+        object.__setattr__(self, "id", id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Rectangle is immutable")
+
+    def __reduce__(self):
+        return Rectangle, (self.width, self.height, self.id)
+
+    def __repr__(self):
+        return f"Rectangle({self.width}, {self.height}, {self.id})"
+
+
+class Solution:
+    __slots__ = ("rectangles", "x", "y", "rotate")
+
+    def __init__(self, rectangles: tuple, x: array, y: array, rotate: bytearray) -> None:
+        """Bottom left positions and rotations of the rectangles of a heuristic run. Index k of the arrays
+        belongs to rectangles[k], the rectangles are ordered by their ids. x is -1 for an unplaced rectangle."""
+        self.rectangles = rectangles
+        self.x = x
+        self.y = y
+        self.rotate = rotate
+
+    @classmethod
+    def from_positions(cls, rectangles, positions: dict):
+        """Creates a solution from the {rectangle: (x, y, rotate)} positions of a run on the rectangles."""
+        rectangles = tuple(sorted(rectangles, key=lambda x: x.id))
+        x = array("q", [-1]) * len(rectangles)
+        y = array("q", [-1]) * len(rectangles)
+        rotate = bytearray(len(rectangles))
+        for k, rectangle in enumerate(rectangles):
+            position = positions.get(rectangle)
+            if position is not None:
+                x[k], y[k], rotate[k] = position
+        return cls(rectangles, x, y, rotate)
+
+    def __len__(self):
+        return len(self.rectangles)
+
+    def __iter__(self):
+        """Yields (rectangle, bottom left position, rotate) for each placed rectangle."""
+        for k, rectangle in enumerate(self.rectangles):
+            if self.x[k] != -1:
+                yield rectangle, (self.x[k], self.y[k]), bool(self.rotate[k])
 
 
 class CandidatePoint:
@@ -25,95 +75,233 @@ class Segment:
         self.point = point
 
 
+class EncodedSolution:
+    __slots__ = ("permutation", "bin_width", "height", "max_spread")
+
+    def __init__(self, permutation: array, bin_width: int, height: int, max_spread: float) -> None:
+        """Solution as the sequence of the rectangle indices and the bin size and max spread value of the run
+        which placed them. The heuristic is deterministic, so placing the sequence again gives the same
+        positions. It takes a few bytes per rectangle to store or to send to another process."""
+        self.permutation = permutation
+        self.bin_width = bin_width
+        self.height = height
+        self.max_spread = max_spread
+
+    def materialise(self, rectangles: list, heuristic_class=None):
+        """Places the rectangles of the instance, given in the order of their indices, again and returns the Solution."""
+        heuristic = (heuristic_class or Heuristic)()
+        heuristic.setup([rectangles[k] for k in self.permutation], self.bin_width, self.height, self.max_spread)
+        heuristic.run()
+        return heuristic.solution()
+
+
+class UnplacedRectangles:
+    def __init__(self, rectangles: list = None) -> None:
+        """Unplaced rectangles indexed by their dimensions. Both orientations of every rectangle are kept
+        ordered by width so the rectangles that fit into a width can be enumerated without scanning
+        the wider ones. Smaller sides of the rectangles are kept ordered too, so the minimum and the
+        second minimum are always at the start of the list."""
+        if rectangles is None:
+            return
+        self.rectangles = dict.fromkeys(rectangles)
+        # (width, height, rectangle, rotate) for each orientation of each rectangle ordered by width
+        self.orientations = sorted(
+            [(rectangle.width, rectangle.height, rectangle, False) for rectangle in rectangles]
+            + [(rectangle.height, rectangle.width, rectangle, True) for rectangle in rectangles],
+            key=lambda x: x[0],
+        )
+        self.widths = [orientation[0] for orientation in self.orientations]
+        self.min_sides = sorted(min(rectangle.width, rectangle.height) for rectangle in rectangles)
+
+    def copy(self):
+        """Returns an independent copy of the index."""
+        index = UnplacedRectangles()
+        index.rectangles = self.rectangles.copy()
+        index.orientations = self.orientations.copy()
+        index.widths = self.widths.copy()
+        index.min_sides = self.min_sides.copy()
+        return index
+
+    def __len__(self):
+        return len(self.rectangles)
+
+    def __iter__(self):
+        return iter(self.rectangles)
+
+    def __contains__(self, rectangle):
+        return rectangle in self.rectangles
+
+    def remove(self, rectangle):
+        """Removes a rectangle with both of its orientations from the index."""
+        del self.rectangles[rectangle]
+        for width in (rectangle.width, rectangle.height):
+            k = bisect.bisect_left(self.widths, width)
+            while self.orientations[k][2] is not rectangle:
+                k += 1
+            self.orientations.pop(k)
+            self.widths.pop(k)
+        self.min_sides.pop(bisect.bisect_left(self.min_sides, min(rectangle.width, rectangle.height)))
+
+    def min_values(self):
+        """Returns the minimum and the second minimum of the smaller sides of the rectangles."""
+        if len(self.min_sides) == 1:
+            return self.min_sides[0], self.min_sides[0]
+        return self.min_sides[0], self.min_sides[1]
+
+    def fitting(self, max_width, max_height):
+        """Returns (rectangle, rotate) pairs for the orientations which fit into the given width and height."""
+        orientations = self.orientations
+        return [
+            (orientations[k][2], orientations[k][3])
+            for k in range(bisect.bisect_right(self.widths, max_width))
+            if orientations[k][1] <= max_height
+        ]
+
+
 class Heuristic:
     def setup(self, sequence: list, bin_width: int, bin_height: int, max_spread: float):
         """Setups the heuristic and initializes values and sets up initial segments"""
         self.sequence = sequence
-        self.unplaced_rectangles = set(sequence)
+        self.unplaced_rectangles = UnplacedRectangles(sequence)
         self.bin_width = bin_width
         self.bin_height = bin_height
         self.max_spread = max_spread
+        # Indices of the rectangles in the sequence for the tiebreaker
+        self.order = {rectangle: i for i, rectangle in enumerate(sequence)}
 
         self.segments = []
         self.segments.append(Segment(x=-1, y=self.bin_height)) # No point for the left dummy segment
         self.segments.append(Segment(x=0, y=0, point=CandidatePoint(x=0, y=0)))
         self.segments.append(Segment(x=bin_width, y=bin_height,point=CandidatePoint(x=self.bin_width, y=0, is_left=False)))
+        # Candidate points are computed for every segment on the first step only. After that we only keep track of
+        # the window of segments changed by the placements and recompute the points affected by that window
+        self.points_valid = False
+        self.reset_changed_window()
+        # Min width of the previous merge, all the segments narrower than it are already merged
+        self.merged_width = 0
+        self.step = 0
+        self.wasted_space = 0
+        # (x, y, rotate) of the placed rectangles in placement order
+        self.positions = {}
+        # Total area of the placed rectangles
+        self.placed_area = 0
+        self.set_free_area()
+
+    def set_free_area(self):
+        """Finds the area of the bin that stays empty if all the rectangles are placed."""
+        self.free_area = self.bin_width * self.bin_height - sum(
+            rectangle.width * rectangle.height for rectangle in self.sequence
+        )
 
     def find_min_values1(self):
         """Finds the minimum and second minimum width and height across the unplaces rectangles"""
-        self.w_min = float("inf")
-        self.w_sec = float("inf")
-        self.h_min = float("inf")
-        self.h_sec = float("inf")
         # Height of the lowest segment in all segments
         self.lowest_y = min(self.segments, key=lambda x: x.y).y
-        # Special case for only one unplaces rectangle left
-        if len(self.unplaced_rectangles) == 1:
-            for rectangle in self.unplaced_rectangles:
-                self.h_min = self.h_sec = self.w_min = self.w_sec = min(
-                    rectangle.width, rectangle.height
-                )
-                return
-        # Since we are allowing rotation h_min and w_min will be same, so will h_sec and w_sec
-        for rectangle in self.unplaced_rectangles:
-            min_width_or_height = min(rectangle.width, rectangle.height)
-            if min_width_or_height < self.w_sec:
-                if min_width_or_height < self.w_min:
-                    self.w_sec = self.h_sec = self.w_min
-                    self.w_min = self.h_min = min_width_or_height
-                else:
-                    self.w_sec = self.h_sec = min_width_or_height
+        # Since we are allowing rotation h_min and w_min will be same, so will h_sec and w_sec.
+        # If there is only one unplaced rectangle left minimum and second minimum are the same
+        self.w_min, self.w_sec = self.unplaced_rectangles.min_values()
+        self.h_min, self.h_sec = self.w_min, self.w_sec
 
     def find_valid_placements(self):
         """(Spread constraint)Finds valid pairs by checking if the rectangle can fit to space if placed to that point
         and the placement doesn't violate the max spread constraint."""
         valid_placements = []
+        # Top of a placed rectangle can't pass the top of the bin height and max spread
+        height_limit = min(self.lowest_y + self.max_spread, self.bin_height)
         # For each point
         for i, segment in enumerate(self.segments[1:], 1):
-            # Count for only fit constraint
-            count = 0
-            # For each unplaced rectangle
-            for rectangle in self.unplaced_rectangles:
-                # Check if it fits according to w_max, if it doesn't pass the top of the bin height and max spread
-                if (
-                    rectangle.width <= segment.point.w_max
-                    and segment.point.y + rectangle.height - self.lowest_y
-                    <= self.max_spread
-                    and segment.point.y + rectangle.height <= self.bin_height
-                ):
-                    valid_placements.append((i, rectangle, False))
-                    count += 1
-                # Check for the rotated version of the rectangle too
-                if (
-                    rectangle.height <= segment.point.w_max
-                    and segment.point.y + rectangle.width - self.lowest_y
-                    <= self.max_spread
-                    and segment.point.y + rectangle.width <= self.bin_height
-                ):
-                    valid_placements.append((i, rectangle, True))
-                    count += 1
+            # Only the rectangles that fit according to w_max and the height limit
+            fitting = self.unplaced_rectangles.fitting(segment.point.w_max, height_limit - segment.point.y)
+            valid_placements.extend((i, rectangle, rotate) for rectangle, rotate in fitting)
             # If there is only one rectangle that we can put on this point
-            if count == 1:
+            if len(fitting) == 1:
                 # Add this pair to only fits
                 self.only_fits.append(valid_placements[-1])
         return valid_placements
 
+    def reset_changed_window(self):
+        """Forgets the changed segments after the candidate points are updated."""
+        # Index of the first changed segment and the number of unchanged segments at the end of the list
+        self.changed_from = float("inf")
+        self.unchanged_tail = float("inf")
+        self.segment_count_at_update = len(self.segments)
+
+    def mark_changed(self, i, unchanged_after):
+        """Widens the changed window to cover the segment at index i."""
+        if i < self.changed_from:
+            self.changed_from = i
+        if unchanged_after < self.unchanged_tail:
+            self.unchanged_tail = unchanged_after
+
+    def update_segment(self, i):
+        """Marks the segment at index i as changed. Call it after changing x or y of a segment."""
+        self.mark_changed(i, len(self.segments) - 1 - i)
+
+    def replace_segments(self, start, stop, segments=()):
+        """Replaces the segments in [start, stop) with the given segments and marks them as changed. The tail of
+        the list is shifted once however many segments are deleted or inserted."""
+        self.mark_changed(start, len(self.segments) - stop)
+        self.segments[start:stop] = segments
+
     def find_candidate_points(self):
-        """Finds points for each segment at the start of each iteration."""
-        for i, segment in enumerate(self.segments[1:], 1):
-            # If the left segment is higher than this segment it means this segment's point will be a left point
-            if segment.y < self.segments[i - 1].y:
-                segment.point = CandidatePoint(segment.x, segment.y, True)
-                segment.point.w_base = self.segments[i + 1].x - segment.x
+        """Finds points for each segment at the start of each iteration.
+        Only the points inside the changed window and the points whose h_left or h_right search passes
+        through this window are recomputed. Indices of the points after the window are shifted."""
+        segment_count = len(self.segments)
+        if not self.points_valid:
+            for i in range(1, segment_count):
+                self.update_candidate_point(i)
+            self.points_valid = True
+            self.reset_changed_window()
+            return
+        if self.changed_from == float("inf"):
+            return
+        # Changed window with one extra segment at each side since a point depends on its neighbors
+        window_start = max(self.changed_from - 1, 1)
+        window_end = min(segment_count - self.unchanged_tail, segment_count - 1)
+        # Old index of the first segment in the unchanged tail before the segments were changed
+        old_tail_start = self.segment_count_at_update - self.unchanged_tail
+        shift = segment_count - self.segment_count_at_update
+        segments = self.segments
+        # Points before the window only need an update if their h_right search reached to the window
+        for i in range(1, window_start):
+            point = segments[i].point
+            if point.h_right >= self.changed_from:
+                point.h_right = self.find_h_right(i)
+                point.w_max = self.find_w_max(i)
+        for i in range(window_start, window_end + 1):
+            self.update_candidate_point(i)
+        # Points after the window only need an update if their h_left search reached to the window
+        for i in range(window_end + 1, segment_count):
+            point = segments[i].point
+            point.h_right += shift
+            if point.h_left >= old_tail_start:
+                point.h_left += shift
             else:
-                segment.point = CandidatePoint(
-                    segment.x, self.segments[i - 1].y, False
-                )
-                segment.point.w_base = segment.x - self.segments[i - 1].x
-            # Find h_left, h_right and w_max values for this point
-            segment.point.h_left = self.find_h_left(i)
-            segment.point.h_right = self.find_h_right(i)
-            segment.point.w_max = self.find_w_max(i)
+                point.h_left = self.find_h_left(i)
+                point.w_max = self.find_w_max(i)
+        self.reset_changed_window()
+
+    def update_candidate_point(self, i):
+        """Computes the candidate point of the segment at index i."""
+        segment = self.segments[i]
+        point = segment.point
+        if point is None:
+            point = segment.point = CandidatePoint(segment.x, segment.y)
+        point.x = segment.x
+        # If the left segment is higher than this segment it means this segment's point will be a left point
+        if segment.y < self.segments[i - 1].y:
+            point.y = segment.y
+            point.is_left = True
+            point.w_base = self.segments[i + 1].x - segment.x
+        else:
+            point.y = self.segments[i - 1].y
+            point.is_left = False
+            point.w_base = segment.x - self.segments[i - 1].x
+        # Find h_left, h_right and w_max values for this point
+        point.h_left = self.find_h_left(i)
+        point.h_right = self.find_h_right(i)
+        point.w_max = self.find_w_max(i)
 
     def find_h_left(self, i):
         """Finds the index of the first higher segment to the left of the point at index i."""
@@ -141,124 +329,98 @@ class Heuristic:
             h_left = self.segments[i].point.h_left
             return self.segments[i].x - self.segments[h_left + 1].x
 
-    def find_top_waste(self, i, rec_width, rec_height):
-        # We consider the space left at the top of the rectangle if we place this rectangle as wasted space
-        # if height of this space is lower than the height of the remaining shortest rectangle
-        # In short if we can't fit any rectangle to this space in next iterations 
-        top_side = self.segments[i].point.y + rec_height
-        min_height = self.h_sec if rec_height == self.h_min else self.h_min
-        height_diff = self.bin_height - top_side
-        if height_diff < min_height:
-            return rec_width * height_diff
-        return 0
-
-    def find_side_wastes(self, i, rec_width, rec_height):
-        # If the gaps between the sides of the rectangle and the first higher segments to the left and right
-        # are lower than the remaining narrowest rectangle's width these spaces are wasted
-        # because we won't be able to fit any rectangles to this space in next iterations
-        min_width = self.w_sec if rec_width == self.w_min else self.w_min
-
-        # x values of the left and right side of the placed rectangle
-        if self.segments[i].point.is_left:
-            left_side = self.segments[i].x
-            right_side = self.segments[i].x + rec_width
-        else:
-            left_side = self.segments[i].x - rec_width
-            right_side = self.segments[i].x
-        top_side = self.segments[i].point.y + rec_height
-        waste = 0
-
-        # Left waste
-        # We know the index of the first higher segment to the left as h_left
-        # But after placing the rectangle, it's top might be higher than this point
-        # So we keep going to left to find the first higher segment than the top side of 
-        # this placement
-        left_index = self.segments[i].point.h_left
-        gap = left_side - self.segments[left_index + 1].x
-        pointer = left_index
-        while self.segments[pointer].y < top_side:
-            gap += self.segments[pointer + 1].x - self.segments[pointer].x
-            pointer -= 1
-        if gap < min_width and gap > 0:
-            while self.segments[pointer + 1].x < left_side:
-                area_width = min(self.segments[pointer + 2].x, left_side) - self.segments[pointer + 1].x
-                area_height = top_side - self.segments[pointer + 1].y
-                waste += area_height * area_width
-                pointer += 1
-
-        # Right waste
-        # We know the index of the first higher segment to the right as h_right
-        right_index = self.segments[i].point.h_right
-        gap = self.segments[right_index].x - right_side
-        pointer = right_index
-        while self.segments[pointer].y < top_side:
-            gap += self.segments[pointer + 1].x - self.segments[pointer].x
-            pointer += 1
-        if gap < min_width and gap > 0:
-            while self.segments[pointer].x > right_side:
-                area_width = self.segments[pointer].x - max(self.segments[pointer - 1].x, right_side)
-                area_height = top_side - self.segments[pointer - 1].y
-                waste += area_height * area_width
+    def find_wastes(self, valid_placements: list, staged: bool = False):
+        """Finds the wasted space of every placement in one pass.
+        Area under the skyline is kept as prefix sums over the segments, so the areas of the gaps
+        below and beside a placement are found without walking the segments under them.
+        If staged is set, the side wastes, which need a walk on the skyline, are only found if the top and
+        bottom wastes don't already exceed the minimum waste so far. All wastes are non negative, so the
+        partial waste returned for such a placement is still higher than the minimum of the placements."""
+        segments = self.segments
+        # Segment and candidate point values as lists indexed by segment, the left dummy segment has no point
+        points = [segment.point for segment in segments[1:]]
+        x = [segment.x for segment in segments]
+        y = [segment.y for segment in segments]
+        is_left = [False] + [point.is_left for point in points]
+        point_y = [0] + [point.y for point in points]
+        w_base = [0] + [point.w_base for point in points]
+        h_left = [0] + [point.h_left for point in points]
+        h_right = [0] + [point.h_right for point in points]
+        widths = [x[k + 1] - x[k] for k in range(len(x) - 1)]
+        # Area under the segments to the left of segment k
+        area = [0, *accumulate(map(mul, y, widths))]
+        # Area of each segment's width with the height of the segment to its right, for the bottom
+        # waste of the right points which pairs the width of segment k - 1 with the height of segment k
+        shifted_area = [0, *accumulate(map(mul, y[1:], widths))]
+        bin_height = self.bin_height
+        w_min, w_sec, h_min, h_sec = self.w_min, self.w_sec, self.h_min, self.h_sec
+        min_waste = float("inf")
+        wastes = []
+        for i, rectangle, rotate in valid_placements:
+            if rotate:
+                rec_width = rectangle.height
+                rec_height = rectangle.width
+            else:
+                rec_width = rectangle.width
+                rec_height = rectangle.height
+            top_side = point_y[i] + rec_height
+            if is_left[i]:
+                left_side = x[i]
+                right_side = left_side + rec_width
+            else:
+                right_side = x[i]
+                left_side = right_side - rec_width
+            waste = 0
+            # Top waste, the space above the rectangle if it is lower than the remaining shortest rectangle
+            height_diff = bin_height - top_side
+            if height_diff < (h_sec if rec_height == h_min else h_min):
+                waste += rec_width * height_diff
+            # Bottom waste, the space under the rectangle if it is wider than the segment of the point
+            if w_base[i] < rec_width:
+                base_y = y[i]
+                if is_left[i]:
+                    end = bisect.bisect_right(x, right_side) - 1
+                    waste += base_y * (right_side - x[i + 1]) - (
+                        area[end] - area[i + 1] + y[end] * (right_side - x[end])
+                    )
+                else:
+                    start = bisect.bisect_left(x, left_side)
+                    waste += (
+                        base_y * (x[i] - x[start])
+                        - (shifted_area[i] - shifted_area[start])
+                        + (x[start] - left_side) * (base_y - y[start])
+                    )
+            if staged and waste > min_waste:
+                wastes.append(waste)
+                continue
+            # Side wastes, the gaps between the sides of the rectangle and the first segments higher than its
+            # top if they are narrower than the remaining narrowest rectangle
+            min_width = w_sec if rec_width == w_min else w_min
+            pointer = h_left[i]
+            while y[pointer] < top_side:
                 pointer -= 1
-        return waste
-
-    def find_bottom_waste(self, i, rec_width):
-        # If width of the rectangle is larger than the w_base of the point
-        # It means there will be leftover under the rectangle afther the placement
-        # We calculate the area of this space here
-        if self.segments[i].point.w_base >= rec_width:
-            return 0
-        waste = 0
-        if self.segments[i].point.is_left:
-            right_side = self.segments[i].x + rec_width
-            pointer = i + 1
-            segment_count = len(self.segments)
-            while (
-                pointer < segment_count - 1
-                and self.segments[pointer + 1].x <= right_side
-            ):
-                area_width = self.segments[pointer + 1].x - self.segments[pointer].x
-                area_height = self.segments[i].y - self.segments[pointer].y
-                waste += area_width * area_height
+            start = pointer + 1
+            gap = left_side - x[start]
+            if 0 < gap < min_width:
+                end = bisect.bisect_left(x, left_side) - 1
+                waste += top_side * gap - (area[end] - area[start] + y[end] * (left_side - x[end]))
+            pointer = h_right[i]
+            while y[pointer] < top_side:
                 pointer += 1
-            area_width = right_side - self.segments[pointer].x
-            area_height = self.segments[i].y - self.segments[pointer].y
-            waste += area_width * area_height
-        else:
-            left_side = self.segments[i].x - rec_width
-            pointer = i
-            while self.segments[pointer - 1].x >= left_side:
-                area_width = self.segments[pointer].x - self.segments[pointer - 1].x
-                area_height = self.segments[i].y - self.segments[pointer].y
-                waste += area_width * area_height
-                pointer -= 1
-            area_width = self.segments[pointer].x - left_side
-            area_height = self.segments[i].y - self.segments[pointer].y
-            waste += area_width * area_height
-        return waste
-
-    def find_waste(self, placement):
-        """Finds the wasted space for a point rectangle pair"""
-        i = placement[0]
-        rectangle = placement[1]
-        if placement[2]:
-            rec_width = rectangle.height
-            rec_height = rectangle.width
-        else:
-            rec_width = rectangle.width
-            rec_height = rectangle.height
-        waste = 0
-        waste += self.find_top_waste(i, rec_width, rec_height)
-        waste += self.find_side_wastes(i, rec_width, rec_height)
-        waste += self.find_bottom_waste(i, rec_width)
-        return waste
+            gap = x[pointer] - right_side
+            if 0 < gap < min_width:
+                start = bisect.bisect_right(x, right_side) - 1
+                waste += top_side * gap - (area[pointer] - area[start] - y[start] * (right_side - x[start]))
+            if waste < min_waste:
+                min_waste = waste
+            wastes.append(waste)
+        return wastes
 
     def min_waste_constraint(self, valid_placements: list):
         """Finds the pairs which have the minimum wasted space."""
         remaining_placemenets = []
         min_waste = float("inf")
-        for placement in valid_placements:
-            waste = self.find_waste(placement)
+        for placement, waste in zip(valid_placements, self.find_wastes(valid_placements, staged=True)):
             if waste < min_waste:
                 remaining_placemenets = [placement]
                 min_waste = waste
@@ -267,50 +429,48 @@ class Heuristic:
         self.wasted_space += min_waste
         return remaining_placemenets
 
-    def find_fitness(self, placement):
-        """Finds the fitness value for a point rectangle point"""
-        fitness = 0
-        i = placement[0]  # Segment index
-        segment = self.segments[i]
-        rectangle = placement[1]
-        # Check rotation
-        if placement[2]:  # placment[2] -> Rotation or not
-            rec_width = rectangle.height
-            rec_height = rectangle.width
-        else:
-            rec_width = rectangle.width
-            rec_height = rectangle.height
-        if segment.point.is_left:
-            # Check left side matches the height
-            if self.segments[i - 1].y - segment.y == rec_height:
-                fitness += 1
-            # Check bottom matches the width
-            if segment.point.w_base == rec_width:
-                fitness += 1
-                # Check right side too if bottom side is perfect placement
-                if self.segments[i + 1].y - segment.y == rec_height:
+    def find_fitnesses(self, valid_placements: list):
+        """Finds the fitness value of every placement in one pass. A placement gets a point for each of its left,
+        bottom and right sides that matches the skyline exactly, the side opposite the point only counts if the
+        bottom matches too, and a point if it touches the top of the bin."""
+        # Only the placements left by the min waste rule are scored, so the segments are read directly
+        segments = self.segments
+        bin_height = self.bin_height
+        fitnesses = []
+        for i, rectangle, rotate in valid_placements:
+            if rotate:
+                rec_width = rectangle.height
+                rec_height = rectangle.width
+            else:
+                rec_width = rectangle.width
+                rec_height = rectangle.height
+            segment = segments[i]
+            point = segment.point
+            fitness = 0
+            if point.is_left:
+                if segments[i - 1].y - segment.y == rec_height:
                     fitness += 1
-        else:
-            # Check right side matches the height
-            if segment.y - self.segments[i - 1].y == rec_height:
-                fitness += 1
-            # Check bottom matches the width
-            if segment.point.w_base == rec_width:
-                fitness += 1
-                # Check left side too if bottom side is perfect placement
-                if self.segments[i - 2].y - self.segments[i - 1].y == rec_height:
+                if point.w_base == rec_width:
+                    fitness += 1
+                    if segments[i + 1].y - segment.y == rec_height:
+                        fitness += 1
+            else:
+                if segment.y - segments[i - 1].y == rec_height:
+                    fitness += 1
+                if point.w_base == rec_width:
                     fitness += 1
-        # Check if rectangle is touching to top of the bin
-        if segment.point.y + rec_height == self.bin_height:
-            fitness += 1
-        return fitness
+                    if segments[i - 2].y - segments[i - 1].y == rec_height:
+                        fitness += 1
+            if point.y + rec_height == bin_height:
+                fitness += 1
+            fitnesses.append(fitness)
+        return fitnesses
 
     def max_fitness_constraint(self, valid_placements: list):
         """Finds the pairs which have the maximum fitness value."""
         remaining_placemenets = []
         max_fitness = -1
-        for placement in valid_placements:
-            fitness = self.find_fitness(placement)
+        for placement, fitness in zip(valid_placements, self.find_fitnesses(valid_placements)):
             if fitness > max_fitness:
                 remaining_placemenets = [placement]
                 max_fitness = fitness
@@ -321,11 +481,12 @@ class Heuristic:
     def tiebreaker(self, valid_placements: list):
         """Finds the pair that has the earliest rectangle in the sequence 
         or pair with the lowest segment or pair with the segment with the minimum x value."""
-        ealiest_rec_index = min(valid_placements, key=lambda x: x[1].index)[1].index
+        order = self.order
+        ealiest_rec_index = min(order[placement[1]] for placement in valid_placements)
         valid_placements = [
             placement
             for placement in valid_placements
-            if placement[1].index == ealiest_rec_index
+            if order[placement[1]] == ealiest_rec_index
         ]
         if len(valid_placements) == 1:
             return valid_placements[0]
@@ -342,16 +503,17 @@ class Heuristic:
         lowest_x = self.segments[
             min(valid_placements, key=lambda x: self.segments[x[0]].point.x)[0]
         ].point.x
-        for placement in valid_placements:
-            if self.segments[placement[0]].point.x == lowest_x:
-                return placement
+        # Same rectangle can still be tied at the same point with both orientations, prefer the unrotated one
+        return min(
+            (placement for placement in valid_placements if self.segments[placement[0]].point.x == lowest_x),
+            key=lambda x: x[2],
+        )
 
     def place(self, placement):
         """Places the rectangle to the given point by adjusting the affected segments, inserting and deleting new segments"""
         i = placement[0]
         rectangle = placement[1]
         rotate = placement[2]
-        rectangle.rotate = rotate
         if rotate:
             rec_width = rectangle.height
             rec_height = rectangle.width
@@ -359,62 +521,103 @@ class Heuristic:
             rec_width = rectangle.width
             rec_height = rectangle.height
 
-        if self.segments[i].point.is_left:
+        segments = self.segments
+        if segments[i].point.is_left:
             # Create a new segment for top of the placed rectangle
-            rectangle.bottom_left_pos = (self.segments[i].x, self.segments[i].y)
-            new_segment = Segment(self.segments[i].x, self.segments[i].y + rec_height)
-            right_side = self.segments[i].x + rec_width
+            self.positions[rectangle] = (segments[i].x, segments[i].y, rotate)
+            new_segment = Segment(segments[i].x, segments[i].y + rec_height)
+            right_side = segments[i].x + rec_width
+            # Segments under the rectangle are deleted and the last one of them is cut from the left
             pointer = i
-            segment_count = len(self.segments)
-            while (
-                pointer < segment_count - 1
-                and self.segments[pointer + 1].x <= right_side
-            ):
-                self.segments.pop(pointer)
-                segment_count -= 1
-            self.segments[pointer].x = right_side
-            self.segments.insert(i, new_segment)
+            segment_count = len(segments)
+            while pointer < segment_count - 1 and segments[pointer + 1].x <= right_side:
+                pointer += 1
+            right_segment = segments[pointer]
+            right_segment.x = right_side
+            self.replace_segments(i, pointer + 1, (new_segment, right_segment))
         else:
-            rectangle.bottom_left_pos = (
-                self.segments[i].x - rec_width,
-                self.segments[i - 1].y,
-            )
-            left_side = self.segments[i].x - rec_width
-            new_segment = Segment(left_side, self.segments[i - 1].y + rec_height)
-            # Increase the height of the current segment# Create a new segment for top of the placed rectangle
+            self.positions[rectangle] = (segments[i].x - rec_width, segments[i - 1].y, rotate)
+            left_side = segments[i].x - rec_width
+            new_segment = Segment(left_side, segments[i - 1].y + rec_height)
+            # Segments under the rectangle are replaced with the new segment
             pointer = i
-            while self.segments[pointer - 1].x >= left_side:
-                self.segments.pop(pointer - 1)
+            while segments[pointer - 1].x >= left_side:
                 pointer -= 1
-            self.segments.insert(pointer, new_segment)
+            self.replace_segments(pointer, i, (new_segment,))
         self.merge_unnecessary_segments(rec_width)
         self.unplaced_rectangles.remove(rectangle)
+        self.placed_area += rec_width * rec_height
 
     def merge_unnecessary_segments(self, cur_placement_width):
-        """Merges the narrow segments with its neighbors and the segments with the same height."""
-        segments_to_remove = set()
+        """Merges the narrow segments with its neighbors and the segments with the same height.
+        The skyline has no segments to merge after the previous merge, so only the segments around the window
+        changed by the placement are checked, and after that only the neighbors of the merged segments until
+        nothing changes. Segments are checked in increasing index order, so each pass merges the same segments
+        as a scan over the whole skyline would."""
         # Min width to compare against segment widths
         min_width = self.w_sec if cur_placement_width == self.w_min else self.w_min
-        for i, segment in enumerate(self.segments[1:-1], 1):
-            # Check for narrow segments
-            segments_to_remove = segments_to_remove.union(
-                self.check_segment_narrow(i, min_width)
-            )
-            # Check for adjacent segments with same height
-            segments_to_remove = segments_to_remove.union(
-                self.check_segment_same_height(i)
-            )
-        # If there is at least one segment to delete we need to run this function again to remove any new narrow segments
-        if len(segments_to_remove) > 0:
-            for segment in segments_to_remove:
-                self.segments.remove(segment)
-            self.merge_unnecessary_segments(cur_placement_width)
-
-    def check_segment_narrow(self, i, min_width):
+        segment_count = len(self.segments)
+        if self.changed_from == float("inf"):
+            candidates = []
+        else:
+            # A check looks at the segment and both of its neighbors
+            first = max(self.changed_from - 1, 1)
+            last = min(segment_count - self.unchanged_tail, segment_count - 2)
+            candidates = list(range(first, last + 1))
+        if min_width > self.merged_width:
+            # Segments outside the window were only checked against the smaller min width of the previous merge
+            candidates = sorted(candidates + self.find_narrow_pits(min_width, candidates))
+        self.merged_width = min_width
+        while candidates:
+            candidates = self.merge_pass(candidates, min_width)
+
+    def merge_pass(self, candidates, min_width):
+        """Checks the candidate segments given in increasing index order and deletes the marked segments.
+        Returns the indices of the segments whose neighbors changed, which are checked in the next pass."""
+        segments_to_remove = []
+        for i in candidates:
+            self.check_segment_narrow(i, min_width, segments_to_remove)
+            self.check_segment_same_height(i, segments_to_remove)
+        if not segments_to_remove:
+            return []
+        # A segment can be marked twice, by the narrow and the same height checks
+        segments_to_remove.sort()
+        removed = [i for k, i in enumerate(segments_to_remove) if k == 0 or segments_to_remove[k - 1] != i]
+        # Delete each run of adjacent segments at once, from the end so the indices of the remaining marked
+        # segments don't change
+        stop = len(removed)
+        for k in range(len(removed) - 1, -1, -1):
+            if k == 0 or removed[k - 1] != removed[k] - 1:
+                self.replace_segments(removed[k], removed[stop - 1] + 1)
+                stop = k
+        last = len(self.segments) - 2
+        changed = []
+        for k, i in enumerate(removed):
+            # New index of the first segment after the deleted one. The segment before it got wider and may have
+            # been raised, so the checks of both segments and the one before them see different values now.
+            i -= k
+            for j in (i - 2, i - 1, i):
+                if 1 <= j <= last and (not changed or changed[-1] < j):
+                    changed.append(j)
+        return changed
+
+    def find_narrow_pits(self, min_width, window):
+        """Returns the indices of the segments outside the window which are lower than both of their neighbors
+        and narrower than min_width."""
+        segments = self.segments
+        return [
+            i
+            for i in range(1, len(segments) - 1)
+            if (not window or i < window[0] or i > window[-1])
+            and segments[i].y < segments[i - 1].y
+            and segments[i].y < segments[i + 1].y
+            and segments[i + 1].x - segments[i].x < min_width
+        ]
+
+    def check_segment_narrow(self, i, min_width, segments_to_remove):
         """If a segment has a width lower than the remaining narrowest rectangles' width, it means we can't place
-        any rectangle onto this segment. So we raise this segment and merge it with the neighbor segments. We check the
-        new merged segments for the same condition recursively."""
-        segments_to_remove = set()
+        any rectangle onto this segment. So we raise this segment and merge it with the neighbor segments.
+        Indices of the segments to delete are appended to segments_to_remove."""
         if (
             self.segments[i].y < self.segments[i - 1].y
             and self.segments[i].y < self.segments[i + 1].y
@@ -425,64 +628,155 @@ class Heuristic:
                 # Check if previos and next segments at the same hight
                 if self.segments[i - 1].y == self.segments[i + 1].y:
                     # We will delete (merge) current and next segment and only the previous one will stay
-                    segments_to_remove.add(self.segments[i])
-                    segments_to_remove.add(self.segments[i + 1])
+                    segments_to_remove.append(i)
+                    segments_to_remove.append(i + 1)
                 # Check if previous segment is lower than the next one
                 elif self.segments[i - 1].y < self.segments[i + 1].y:
                     # We will only delete (merge) current segment
-                    segments_to_remove.add(self.segments[i])
+                    segments_to_remove.append(i)
                 # If next segment is lower than the previous one
                 else:
                     # Only delete the next segment (merge with this one)
                     self.segments[i].y = self.segments[i + 1].y
-                    segments_to_remove.add(self.segments[i + 1])
-        return segments_to_remove
+                    self.update_segment(i)
+                    segments_to_remove.append(i + 1)
 
-    def check_segment_same_height(self, i):
+    def check_segment_same_height(self, i, segments_to_remove):
         """Checks and marks the segments with the same height accordingly to be deleted later."""
-        segments_to_remove = set()
         # Special check for the first segment
         if i == 1 and self.segments[i - 1].y == self.segments[i].y:
-            segments_to_remove.add(self.segments[i])
+            segments_to_remove.append(i)
         if self.segments[i].y == self.segments[i + 1].y:
-            segments_to_remove.add(self.segments[i + 1])
-        return segments_to_remove
-
-    def run(self, quit=None):
-        """Runs the heuristic. Use setup function before running the heuristic."""
-        for i in range(len(self.sequence)):
-            self.sequence[i].index = i
-        self.wasted_space = 0
+            segments_to_remove.append(i + 1)
+
+    def snapshot(self):
+        """Returns the state of the heuristic at the current step to continue from it later."""
+        return (
+            self.step,
+            self.wasted_space,
+            [(segment.x, segment.y) for segment in self.segments],
+            self.unplaced_rectangles.copy(),
+            self.positions.copy(),
+        )
+
+    def restore(self, state):
+        """Continues from a state returned by snapshot. Use setup function with the same bin size
+        and max spread values before restoring."""
+        self.step, self.wasted_space, segments, unplaced_rectangles, positions = state
+        self.segments = [Segment(x, y) for x, y in segments]
+        self.unplaced_rectangles = unplaced_rectangles.copy()
+        self.positions = positions.copy()
+        self.placed_area = sum(rectangle.width * rectangle.height for rectangle in positions)
+        # Candidate points are computed again on the next step
+        self.points_valid = False
+        self.reset_changed_window()
+        self.merged_width = 0
+
+    def find_enclosed_waste(self):
+        """Finds the empty area under the skyline. Rectangles are only placed on top of the skyline, so this area
+        stays empty until the end of the run and the run can't be successful once it is larger than the free area."""
+        segments = self.segments
+        skyline_area = sum(segments[k].y * (segments[k + 1].x - segments[k].x) for k in range(1, len(segments) - 1))
+        return skyline_area - self.placed_area
+
+    def solution(self):
+        """Returns the positions of the rectangles placed by the run."""
+        return Solution.from_positions(self.sequence, self.positions)
+
+    def run(self, quit=None, checkpoints=None, waste_cutoff=None):
+        """Runs the heuristic. Use setup function before running the heuristic.
+        If a RunCheckpoints object is given, states and tiebreaks of this run are recorded into it.
+        If a waste cutoff is given, the run stops as soon as the wasted space is higher than the cutoff and the
+        empty area under the skyline is higher than the free area of the bin, so the run can neither be successful
+        nor have a lower wasted space than the cutoff. Then the run returns False with pruned set to True."""
+        self.pruned = False
         # Place a rectangle at each step
-        for _ in self.sequence:
+        while self.step < len(self.sequence):
             if quit and quit.is_set():
                 return False
+            if checkpoints and self.step % checkpoints.interval == 0:
+                checkpoints.save(self)
             self.find_min_values1()
             self.find_candidate_points()
             self.only_fits = []
             valid_placements = self.find_valid_placements()
             if len(valid_placements) == 0:
-                for rectangle in self.unplaced_rectangles:
-                    rectangle.bottom_left_pos = None
-                    rectangle.rotate = False
+                if checkpoints:
+                    checkpoints.finish(self, False)
                 return False
             if len(self.only_fits) == 1:
-                self.place(self.only_fits[0])
-                continue
-            elif len(self.only_fits) > 1:
-                valid_placements = self.only_fits
-            valid_placements = self.min_waste_constraint(valid_placements)
-            if len(valid_placements) == 1:
-                self.place(valid_placements[0])
-                continue
-            valid_placements = self.max_fitness_constraint(valid_placements)
-            if len(valid_placements) == 1:
-                self.place(valid_placements[0])
-                continue
-            placement = self.tiebreaker(valid_placements)
+                placement = self.only_fits[0]
+            else:
+                if len(self.only_fits) > 1:
+                    valid_placements = self.only_fits
+                valid_placements = self.min_waste_constraint(valid_placements)
+                if len(valid_placements) > 1:
+                    valid_placements = self.max_fitness_constraint(valid_placements)
+                if len(valid_placements) > 1:
+                    placement = self.tiebreaker(valid_placements)
+                    if checkpoints:
+                        checkpoints.record_tie(self.step, {self.order[placement[1]] for placement in valid_placements})
+                else:
+                    placement = valid_placements[0]
+            if (
+                waste_cutoff is not None
+                and self.wasted_space > waste_cutoff
+                and self.find_enclosed_waste() > self.free_area
+            ):
+                self.pruned = True
+                return False
             self.place(placement)
+            self.step += 1
+        if checkpoints:
+            checkpoints.finish(self, True)
         return True
-    
+
+
+class RunCheckpoints:
+    def __init__(self, interval: int) -> None:
+        """States saved at every interval steps of a heuristic run on a sequence, together with the tiebreaks
+        of the run. The order of the rectangles in the sequence only matters when the tiebreaker picks the
+        earliest rectangle, so a sequence with two swapped rectangles places exactly the same rectangles
+        until the first tiebreak whose pick changes with the swap. Runs on these sequences can continue from
+        the last state before that step instead of starting from an empty bin."""
+        self.interval = interval
+        self.states = []
+        # (step, indices of the tied rectangles in the sequence) for each tiebreak between different rectangles
+        self.ties = []
+        self.success = False
+        self.wasted_space = 0
+
+    def save(self, heuristic):
+        """Saves the state of the heuristic at its current step."""
+        self.states.append(heuristic.snapshot())
+
+    def record_tie(self, step, indices):
+        """Records the sequence indices of the rectangles given to the tiebreaker at this step."""
+        if len(indices) > 1:
+            self.ties.append((step, indices))
+
+    def finish(self, heuristic, success):
+        """Records the result of the run."""
+        self.success = success
+        self.wasted_space = heuristic.wasted_space
+
+    def divergence_step(self, i, j):
+        """Finds the first step where the run on the sequence with the rectangles at index i and j swapped
+        places a different rectangle. Returns None if it places the same rectangles at every step."""
+        def swapped(k):
+            return j if k == i else i if k == j else k
+
+        for step, indices in self.ties:
+            if i in indices or j in indices:
+                # Tiebreaker picks the rectangle with the minimum index
+                if min(swapped(k) for k in indices) != swapped(min(indices)):
+                    return step
+        return None
+
+    def state_before(self, step):
+        """Returns the last saved state at or before the given step."""
+        return self.states[min(step // self.interval, len(self.states) - 1)]
+
 # We maintain a list of segments. Each element in the list represents the left point of a segment
 # Initially there are 3 segments A[0] = (-1, H), A[1] = (0, 0), A[2] = (W, H). A[0] and A[2] are dummy segments
 # If we have n segments then we have n + 1 candidate points to place a rectangle
@@ -507,6 +801,7 @@ class Heuristic:
 
 # Once we find the best pair. We place the rectangular on that point. And update the segments. There will be deleted and inserted segments. 
 # We find the candidate points and their h_left, h_right, w_base, w_max values at the beginning of each iteration
+#   Only the points around the segments changed by the previous placement are recomputed, the rest are kept as they are
 
 # At any iteration if we can't a single point rectangle pair to place we return with failure
 # If we place all rectangles we return with success
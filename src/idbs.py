@@ -1,11 +1,78 @@
-import copy
 import math
+import multiprocessing
 import time
+from array import array
+
+from heuristic import EncodedSolution
 from tabu_search import TabuSearchSolver
 
 
+class SharedIncumbent:
+    def __init__(self, rectangle_count: int) -> None:
+        """Best solution found by any of the IDBS processes, kept in shared memory. A solution is stored as its height,
+        the max spread value and the sequence as indices of the rectangles, which is enough to place the rectangles again
+        with the heuristic. Create it before starting the processes and give the same object to all of them.
+        Rectangle count is the largest rectangle count of the instances it is used for."""
+        self.lock = multiprocessing.Lock()
+        # 0 means no solution is found yet
+        self.height = multiprocessing.RawValue("i", 0)
+        self.spread = multiprocessing.RawValue("d", 0.0)
+        self.sequence = multiprocessing.RawArray("i", rectangle_count)
+        self.sequence_length = multiprocessing.RawValue("i", 0)
+        # Id of the process which found the best solution
+        self.worker_id = multiprocessing.RawValue("i", -1)
+
+    def reset(self):
+        """Forgets the best solution to use the same object for a new search."""
+        with self.lock:
+            self.height.value = 0
+            self.sequence_length.value = 0
+            self.worker_id.value = -1
+
+    def best_height(self):
+        """Returns the height of the best solution or None if there isn't one."""
+        return self.height.value or None
+
+    def offer(self, solution: EncodedSolution, worker_id=-1):
+        """Stores the solution if it is better than the current best one. Returns True if it is stored."""
+        with self.lock:
+            if self.height.value and self.height.value <= solution.height:
+                return False
+            self.sequence[: len(solution.permutation)] = solution.permutation
+            self.sequence_length.value = len(solution.permutation)
+            self.spread.value = solution.max_spread
+            self.worker_id.value = worker_id
+            self.height.value = solution.height
+            return True
+
+    def encode(self, bin_width):
+        """Returns the best solution as an EncodedSolution or None if there isn't one. Call it with the lock held."""
+        height = self.height.value
+        if not height:
+            return None
+        permutation = array("I", self.sequence[: self.sequence_length.value])
+        return EncodedSolution(permutation, bin_width, height, self.spread.value)
+
+    def best_solution(self, bin_width):
+        """Returns the best solution so far as an EncodedSolution or None if there isn't one. It can be read
+        while the processes are still searching."""
+        with self.lock:
+            return self.encode(bin_width)
+
+    def result(self, bin_width):
+        """Returns the best solution as (EncodedSolution, height, id of the process which found it) or None if
+        there isn't one. Read it after all the processes have stopped, a process can still offer a better
+        solution until it notices the quit event."""
+        with self.lock:
+            solution = self.encode(bin_width)
+            if solution is None:
+                return None
+            return solution, solution.height, self.worker_id.value
+
+
 class IDBS:
-    def __init__(self, time_limit, bin_width, bin_height, tabu_seq_length=10, tabu_tenure_multiplier=3):
+    def __init__(self, time_limit, bin_width, bin_height, tabu_seq_length=10, tabu_tenure_multiplier=3, checkpoint_interval=4,
+                 neighbour_workers=0, cache_size=50000, profile=False, trace=None):
         """Iterative Doubling Binary Search.
         Tries to find the optimal bin height to fit the given rectangles into.
         Lower bound is set as the total area of all rectangles divided by the bin width.
@@ -18,22 +85,78 @@ class IDBS:
         and wider range. If we give a lower iteration count to tabu search it means it won't search as deep. If we give a
         large iteration count it will widen the search range of the tabu search by allowing it to generate new sequences from the
         previous best sequence longer. If we reach the desired height and place all the rectangles to this height successfully, then we 
-        return with success."""
+        return with success. Set checkpoint_interval to control how often the tabu search saves heuristic states to continue the runs on generated sequences from.
+        With neighbour_workers the tabu search evaluates its generated sequences on that many worker processes.
+        cache_size is the number of heuristic results the tabu search keeps to avoid running the same sequence again.
+        With profile the phases of the heuristic runs done in this process are recorded into self.profile.
+        If a SearchTrace is given, the bounds, the heights tried and the tabu iterations are recorded into it."""
         self.time_limit = time_limit
         self.bin_width = bin_width
         self.bin_height = bin_height
-        self.solver = TabuSearchSolver(tabu_seq_length, tabu_tenure_multiplier)
+        self.solver = TabuSearchSolver(
+            tabu_seq_length,
+            tabu_tenure_multiplier,
+            checkpoint_interval,
+            neighbour_workers,
+            cache_size=cache_size,
+            profile=profile,
+        )
+        self.profile = self.solver.profile
+        self.trace = trace
+        self.solver.trace = trace
         self.best_seq = None
+        self.worker_id = -1
+
+    def emit(self, event, **fields):
+        """Records an event into the trace if there is one."""
+        if self.trace is not None:
+            self.trace.emit(event, **fields)
 
-    def reset_rectangles(self):
-        """Reset bottom left position and rotation values of the rectangles"""
-        for rectangle in self.rectangles:
-            rectangle.bottom_left_pos = None
-            rectangle.rotate = False
+    def apply_assignment(self, assignment=None, worker_id=-1):
+        """Gives the process its part of the search. Without an assignment the process searches all start points
+        with a random seed of its own, so the forked processes don't share the same random state. Worker id
+        identifies the process in the trace and the shared incumbent, the assignment's id is used if there is one."""
+        self.worker_id = worker_id
+        if assignment is None:
+            self.solver.random.seed()
+            return
+        self.worker_id = assignment.worker_id
+        self.solver.random.seed(assignment.seed)
+        self.solver.start_points = assignment.start_points
+        self.solver.seq_length = assignment.tabu_seq_length
+        self.solver.tabu_duration = assignment.tabu_tenure_multiplier
 
-    def run(self, rectangles, quit, found, return_queue):
-        self.rectangles = copy.deepcopy(rectangles)
-        self.reset_rectangles()
+    def record_solution(self, height, incumbent=None):
+        """Records the solution found by the tabu search and shares it with the other processes."""
+        solution = self.solver.encode_best(self.bin_width, height)
+        self.best_seq = (solution, height, self.worker_id)
+        if incumbent is not None:
+            incumbent.offer(solution, self.worker_id)
+
+    def finish(self, found, return_queue, incumbent=None, reason=None):
+        """Puts the best solution to the queue if there is no shared incumbent and informs the other processes."""
+        self.emit("finish", reason=reason, height=self.best_seq[1] if self.best_seq else None)
+        if self.trace is not None:
+            self.trace.close()
+        # Stop the worker processes of the tabu search if there are any
+        self.solver.close()
+        # Solutions of the process are already offered to the incumbent
+        if incumbent is None:
+            return_queue.put(self.best_seq)
+        found.set()
+
+    def run(self, rectangles, quit, found, return_queue, incumbent=None, assignment=None, worker_id=-1):
+        """Runs the search. If a SharedIncumbent is given, the upper bound is lowered as soon as any process finds
+        a better solution and the solutions are only offered to the incumbent, nothing is put to the return queue.
+        If a PortfolioAssignment is given, only its part of the search is done. Worker id is the id of the process
+        in its pool, which is given by the assignment if there is one.
+        Without an incumbent the solution is put to the queue as (EncodedSolution, height, id of the process which
+        found it)."""
+        self.apply_assignment(assignment, worker_id)
+        if self.trace is not None:
+            self.trace.worker_id = self.worker_id
+        # Rectangles are immutable, the positions are kept in the solutions
+        self.rectangles = rectangles
 
         # Lower bound for problems with no known optimum height
         total_rec_area = sum(rec.width * rec.height for rec in self.rectangles)
@@ -48,6 +171,16 @@ class IDBS:
         iter = 1
         ub_found = False
         t0 = time.time()
+        # A single tabu search with a large iteration count can take longer than the time limit, so it gets the
+        # deadline too
+        deadline = t0 + self.time_limit
+        self.emit(
+            "start",
+            rectangles=len(self.rectangles),
+            lower_bound=lower_bound,
+            upper_bound=upper_bound,
+            time_limit=self.time_limit,
+        )
         # while any other process hasn't found a solution and time limit not exceeded and LB != UB do
         while (
             not quit.is_set()
@@ -57,16 +190,40 @@ class IDBS:
             tmp_lower_bound = lower_bound
             # while tempLB < UB do
             while tmp_lower_bound < upper_bound:
+                # A tabu search stopped by the time limit fails, which doesn't mean the height is infeasible
+                if time.time() >= deadline:
+                    break
+                # Lower the upper bound if another process found a better solution
+                shared_height = incumbent.best_height() if incumbent is not None else None
+                if shared_height is not None and shared_height < upper_bound:
+                    upper_bound = shared_height
+                    ub_found = True
+                    self.emit("shared_upper_bound", upper_bound=upper_bound)
+                    continue
                 height = (tmp_lower_bound + upper_bound) // 2
+                t1 = time.time()
+                success = self.solver.run(self.rectangles, self.bin_width, height, iter, quit, deadline)
+                self.emit(
+                    "attempt",
+                    height=height,
+                    lower_bound=tmp_lower_bound,
+                    upper_bound=upper_bound,
+                    iter=iter,
+                    tabu_iterations=self.solver.iterations,
+                    wasted_space=self.solver.best_wasted_space,
+                    duration=round(time.time() - t1, 6),
+                    success=success,
+                    cancelled=quit.is_set(),
+                    timed_out=time.time() >= deadline,
+                )
                 # if tabu search (H,iter) is successful then
-                if self.solver.run(self.rectangles, self.bin_width, height, iter, quit):
+                if success:
                     # Record solution
-                    self.best_seq = (copy.deepcopy(self.solver.best_seq), height)
+                    self.record_solution(height, incumbent)
                     # Return the solution immediately if we found a solution with desired height
                     if height == self.bin_height:
-                        return_queue.put(self.best_seq)
                         # Inform other processes that this process found a solution
-                        found.set()
+                        self.finish(found, return_queue, incumbent, "found")
                         return
                     # Lower the upper bound
                     upper_bound = height
@@ -77,8 +234,15 @@ class IDBS:
             if not ub_found:
                 # Raise the upper bound if we haven't found a single solution
                 upper_bound = math.ceil(upper_bound * 1.1)
+                self.emit("raise_upper_bound", upper_bound=upper_bound)
             # Double the iteration count for next search
             iter *= 2
+            self.emit("double_iter", iter=iter, lower_bound=lower_bound, upper_bound=upper_bound)
         # If we didn't find an optimal solution in the given time limit return the best solution found so far
-        return_queue.put(self.best_seq)
-        found.set()
+        if quit.is_set():
+            reason = "quit"
+        elif lower_bound == upper_bound:
+            reason = "bounds_met"
+        else:
+            reason = "time_limit"
+        self.finish(found, return_queue, incumbent, reason)
@@ -0,0 +1,38 @@
+import fnmatch
+import os
+
+from heuristic import Rectangle
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+# Names of the Hopper-Turton C test files, other files in the data directory are not instances
+INSTANCE_PATTERN = "C*_*"
+
+
+def read_rectangles_from_file(file_path):
+    """Reads an instance file. Returns the rectangles, the bin width and the optimum height."""
+    rectangles = []
+    with open(file_path, "r") as dataset:
+        rectangle_count = int(dataset.readline())
+        bin_width, bin_height = map(int, dataset.readline().split(" "))
+        for i in range(rectangle_count):
+            rec_width, rec_height = map(int, dataset.readline().split(" ")[:2])
+            rectangle = Rectangle(rec_width, rec_height, i)
+            rectangles.append(rectangle)
+    return (rectangles, bin_width, bin_height)
+
+
+def read_rectangle_count(file_path):
+    """Reads only the rectangle count of an instance file, e.g. to size the shared memory before the rectangles
+    are read."""
+    with open(file_path, "r") as dataset:
+        return int(dataset.readline())
+
+
+def find_instance_files(directory):
+    """Returns the paths of the instance files directly inside the directory in name order."""
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if fnmatch.fnmatch(name, INSTANCE_PATTERN) and os.path.isfile(os.path.join(directory, name))
+    ]
@@ -0,0 +1,101 @@
+import multiprocessing
+from array import array
+
+# Seconds between the checks of the quit event while the results of a batch are awaited
+POLL_INTERVAL = 0.05
+# Rectangles, heuristic, cancel event and waste cutoff of a worker process. Set once by init_worker when the pool starts
+worker_state = {}
+
+
+def init_worker(rectangles, heuristic_class, cancel, waste_cutoff):
+    """Stores the data shared by all tasks in the worker process."""
+    worker_state["rectangles"] = rectangles
+    worker_state["heuristic"] = heuristic_class()
+    worker_state["cancel"] = cancel
+    worker_state["waste_cutoff"] = waste_cutoff
+
+
+def evaluate_permutation(task):
+    """Runs the heuristic on a permutation of the worker's rectangles.
+    Returns the task index, if the run was successful and the wasted space. Wasted space is None
+    if the task is cancelled because another sequence in the batch was successful and infinite if
+    the run is pruned by the minimum wasted space of the batch so far."""
+    index, permutation, bin_width, bin_height, max_spread = task
+    cancel = worker_state["cancel"]
+    if cancel.is_set():
+        return index, False, None
+    rectangles = worker_state["rectangles"]
+    heuristic = worker_state["heuristic"]
+    heuristic.setup([rectangles[k] for k in permutation], bin_width, bin_height, max_spread)
+    waste_cutoff = worker_state["waste_cutoff"]
+    success = heuristic.run(cancel, waste_cutoff=waste_cutoff.value if waste_cutoff is not None else None)
+    if not success and cancel.is_set():
+        return index, False, None
+    if heuristic.pruned:
+        return index, False, float("inf")
+    return index, success, heuristic.wasted_space
+
+
+class NeighbourPool:
+    def __init__(self, processes: int, rectangles: list, heuristic_class, prune: bool = False) -> None:
+        """Worker processes to run the heuristic on the generated sequences of a tabu search iteration in parallel.
+        Rectangles are sent to the workers once when the pool starts, after that only the permutations of
+        the rectangles are sent and only the results are received. As soon as a sequence is placed
+        successfully the rest of the batch is cancelled. If prune is set the runs started after
+        a result is received are pruned by the minimum wasted space of the batch so far."""
+        self.rectangles = rectangles
+        self.rectangle_ids = {rectangle: k for k, rectangle in enumerate(rectangles)}
+        self.cancel = multiprocessing.Event()
+        # Only written by this process, workers read it when they start a task
+        self.waste_cutoff = multiprocessing.RawValue("d", float("inf")) if prune else None
+        self.pool = multiprocessing.Pool(
+            processes,
+            initializer=init_worker,
+            initargs=(rectangles, heuristic_class, self.cancel, self.waste_cutoff),
+        )
+
+    def evaluate(self, sequences: list, bin_width, bin_height, max_spread, waste_cutoff=float("inf"), quit=None):
+        """Runs the heuristic on each sequence. Returns a list of (success, wasted space) tuples in the order of
+        the sequences, the sequences cancelled after a success are None. Waste cutoff is the minimum wasted
+        space already known for the batch. If the quit event is set while the batch runs, the rest of the batch
+        is cancelled the same way and the cancelled sequences are None too."""
+        tasks = [
+            (
+                k,
+                array("I", (self.rectangle_ids[rectangle] for rectangle in sequence)),
+                bin_width,
+                bin_height,
+                max_spread,
+            )
+            for k, sequence in enumerate(sequences)
+        ]
+        results = [None] * len(sequences)
+        if self.waste_cutoff is not None:
+            self.waste_cutoff.value = waste_cutoff
+        pending = self.pool.imap_unordered(evaluate_permutation, tasks)
+        for _ in range(len(tasks)):
+            while True:
+                # Workers only see the cancel event, so it is set for them once the quit event is set
+                if quit is not None and quit.is_set():
+                    self.cancel.set()
+                try:
+                    index, success, wasted_space = pending.next(POLL_INTERVAL if quit is not None else None)
+                    break
+                except multiprocessing.TimeoutError:
+                    pass
+            if wasted_space is None:
+                continue
+            results[index] = (success, wasted_space)
+            if self.waste_cutoff is not None and wasted_space < self.waste_cutoff.value:
+                self.waste_cutoff.value = wasted_space
+            if success:
+                # Remaining tasks return immediately and running ones stop at their next step
+                self.cancel.set()
+        # All tasks of the batch are finished here so the next batch can't be cancelled by this one
+        self.cancel.clear()
+        return results
+
+    def close(self):
+        """Stops the worker processes."""
+        self.pool.terminate()
+        self.pool.join()
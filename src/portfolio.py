@@ -0,0 +1,55 @@
+import random
+
+from tabu_search import INITIAL_SEQUENCE_COUNT, SPREAD_VALUE_COUNT
+
+# Changes to the tabu tenure multiplier for the processes sharing the same start points
+TENURE_OFFSETS = (0, -1, 1)
+# Increase in the new sequence count for each round of processes sharing the same start points
+SEQ_LENGTH_STEP = 5
+
+
+class PortfolioAssignment:
+    def __init__(self, worker_id, seed, start_points, tabu_seq_length, tabu_tenure_multiplier) -> None:
+        """Part of the search given to one of the IDBS processes. Start points are the (initial sequence index,
+        spread value index) pairs the process starts its tabu searches from."""
+        self.worker_id = worker_id
+        self.seed = seed
+        self.start_points = start_points
+        self.tabu_seq_length = tabu_seq_length
+        self.tabu_tenure_multiplier = tabu_tenure_multiplier
+
+    def describe(self):
+        """Returns the assignment as a dictionary to report it with the results."""
+        return {
+            "worker_id": self.worker_id,
+            "seed": self.seed,
+            "start_points": self.start_points,
+            "tabu_seq_length": self.tabu_seq_length,
+            "tabu_tenure_multiplier": self.tabu_tenure_multiplier,
+        }
+
+
+def create_portfolio(worker_count, tabu_seq_length, tabu_tenure_multiplier, seed=None):
+    """Splits the start points of the tabu search between the processes so they don't repeat each other's work.
+    Each process gets its own seed. If there are more processes than start points, the processes sharing the
+    same start point get different new sequence counts and tabu tenures."""
+    if seed is None:
+        seed = random.randrange(2**32)
+    start_points = [(k, p) for k in range(INITIAL_SEQUENCE_COUNT) for p in range(SPREAD_VALUE_COUNT)]
+    assignments = []
+    for worker_id in range(worker_count):
+        if worker_count <= len(start_points):
+            worker_start_points = start_points[worker_id::worker_count]
+        else:
+            worker_start_points = [start_points[worker_id % len(start_points)]]
+        repeat = worker_id // len(start_points)
+        assignments.append(
+            PortfolioAssignment(
+                worker_id,
+                seed + worker_id,
+                worker_start_points,
+                tabu_seq_length + repeat * SEQ_LENGTH_STEP,
+                max(1, tabu_tenure_multiplier + TENURE_OFFSETS[repeat % len(TENURE_OFFSETS)]),
+            )
+        )
+    return assignments
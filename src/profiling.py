@@ -0,0 +1,151 @@
+import time
+
+# Phases of a heuristic step in the order they are called
+PHASES = (
+    "find_min_values1",
+    "find_candidate_points",
+    "find_valid_placements",
+    "min_waste_constraint",
+    "max_fitness_constraint",
+    "tiebreaker",
+    "place",
+    "merge_unnecessary_segments",
+)
+
+
+class PhaseStats:
+    def __init__(self) -> None:
+        """Call count, cumulative time and recorded sizes of a heuristic phase. A size is kept as its total and
+        max value over the calls."""
+        self.calls = 0
+        self.time = 0.0
+        self.sizes = {}
+
+    def add(self, elapsed, **sizes):
+        """Records a call of the phase."""
+        self.calls += 1
+        self.time += elapsed
+        for name, value in sizes.items():
+            total, largest = self.sizes.get(name, (0, 0))
+            self.sizes[name] = (total + value, max(largest, value))
+
+    def merge(self, other):
+        """Adds the calls of another PhaseStats to this one."""
+        self.calls += other.calls
+        self.time += other.time
+        for name, (value, largest) in other.sizes.items():
+            total, own_largest = self.sizes.get(name, (0, 0))
+            self.sizes[name] = (total + value, max(own_largest, largest))
+
+    def as_dict(self):
+        """Returns the stats with the mean and max of each size."""
+        result = {"calls": self.calls, "time": self.time}
+        for name, (total, largest) in self.sizes.items():
+            result[f"mean_{name}"] = total / self.calls if self.calls else 0
+            result[f"max_{name}"] = largest
+        return result
+
+
+class HeuristicProfile:
+    def __init__(self) -> None:
+        """Phase stats of the heuristic runs aggregated across runs."""
+        self.runs = 0
+        self.run_time = 0.0
+        self.phases = {phase: PhaseStats() for phase in PHASES}
+
+    def merge(self, other):
+        """Adds the runs of another profile, e.g. the profile of another process, to this one."""
+        self.runs += other.runs
+        self.run_time += other.run_time
+        for phase, stats in other.phases.items():
+            self.phases[phase].merge(stats)
+
+    def as_dict(self):
+        return {
+            "runs": self.runs,
+            "run_time": self.run_time,
+            "phases": {phase: stats.as_dict() for phase, stats in self.phases.items()},
+        }
+
+    def __str__(self):
+        lines = [f"{self.runs} runs in {self.run_time:.3f}s"]
+        for phase, stats in self.phases.items():
+            share = stats.time / self.run_time * 100 if self.run_time else 0
+            sizes = ", ".join(f"{name} {value:.1f}" for name, value in stats.as_dict().items() if name.startswith("mean_"))
+            lines.append(f"{phase:<28} {stats.calls:>9} calls {stats.time:>9.3f}s {share:>5.1f}%  {sizes}")
+        return "\n".join(lines)
+
+
+def profiled_class(heuristic_class, profile: HeuristicProfile):
+    """Returns a subclass of the heuristic class which records its phases into the profile. Only the
+    subclass is timed, so the heuristic classes themselves don't pay anything when profiling is off.
+    Recorded sizes are the segment count for the candidate points, the placement count given to each
+    selection rule and the pass count and removed segment count of the merges. The time of place includes the
+    merge done at the end of it."""
+    phases = profile.phases
+    perf_counter = time.perf_counter
+
+    class ProfiledHeuristic(heuristic_class):
+        merge_passes = 0
+
+        def run(self, *args, **kwargs):
+            t0 = perf_counter()
+            result = super().run(*args, **kwargs)
+            profile.runs += 1
+            profile.run_time += perf_counter() - t0
+            return result
+
+        def find_min_values1(self):
+            t0 = perf_counter()
+            super().find_min_values1()
+            phases["find_min_values1"].add(perf_counter() - t0)
+
+        def find_candidate_points(self):
+            t0 = perf_counter()
+            super().find_candidate_points()
+            phases["find_candidate_points"].add(perf_counter() - t0, segments=len(self.segments))
+
+        def find_valid_placements(self):
+            t0 = perf_counter()
+            valid_placements = super().find_valid_placements()
+            phases["find_valid_placements"].add(perf_counter() - t0, placements=len(valid_placements))
+            return valid_placements
+
+        def min_waste_constraint(self, valid_placements: list):
+            t0 = perf_counter()
+            result = super().min_waste_constraint(valid_placements)
+            phases["min_waste_constraint"].add(perf_counter() - t0, placements=len(valid_placements))
+            return result
+
+        def max_fitness_constraint(self, valid_placements: list):
+            t0 = perf_counter()
+            result = super().max_fitness_constraint(valid_placements)
+            phases["max_fitness_constraint"].add(perf_counter() - t0, placements=len(valid_placements))
+            return result
+
+        def tiebreaker(self, valid_placements: list):
+            t0 = perf_counter()
+            result = super().tiebreaker(valid_placements)
+            phases["tiebreaker"].add(perf_counter() - t0, placements=len(valid_placements))
+            return result
+
+        def place(self, placement):
+            t0 = perf_counter()
+            super().place(placement)
+            phases["place"].add(perf_counter() - t0)
+
+        def merge_unnecessary_segments(self, cur_placement_width):
+            self.merge_passes = 0
+            segment_count = len(self.segments)
+            t0 = perf_counter()
+            super().merge_unnecessary_segments(cur_placement_width)
+            phases["merge_unnecessary_segments"].add(
+                perf_counter() - t0, passes=self.merge_passes, removed=segment_count - len(self.segments)
+            )
+
+        def merge_pass(self, candidates, min_width):
+            self.merge_passes += 1
+            return super().merge_pass(candidates, min_width)
+
+    ProfiledHeuristic.__name__ = f"Profiled{heuristic_class.__name__}"
+    return ProfiledHeuristic
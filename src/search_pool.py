@@ -0,0 +1,158 @@
+import multiprocessing
+import multiprocessing.reduction
+import queue
+import traceback
+
+from idbs import IDBS, SharedIncumbent
+
+# Seconds between the checks of the processes while the result of a search is awaited
+POLL_INTERVAL = 0.2
+
+
+def search_worker(worker_id, jobs, done, quit, found, incumbent):
+    """Main loop of a search process. Instances are received once and kept by their key,
+    after that a run only needs the key of the instance. Puts the worker id to the done queue
+    after each run so the pool knows the process has stopped searching. A run that raises ends the
+    search like a finished run, and the process waits for the next job."""
+    instances = {}
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        if job[0] == "instance":
+            _, key, rectangles = job
+            instances[key] = rectangles
+            continue
+        if job[0] == "remove_instance":
+            instances.pop(job[1], None)
+            continue
+        _, key, bin_width, bin_height, idbs_args, assignment = job
+        idbs = None
+        try:
+            idbs = IDBS(idbs_args.pop("time_limit"), bin_width, bin_height, **idbs_args)
+            # Solutions are read from the incumbent by the pool, so there is no return queue
+            idbs.run(instances[key], quit, found, None, incumbent, assignment, worker_id)
+        except Exception:
+            traceback.print_exc()
+            if idbs is not None:
+                idbs.solver.close()
+            # The best solution of the other processes is still returned by the pool
+            found.set()
+        finally:
+            done.put(worker_id)
+
+
+class SearchPool:
+    def __init__(self, processes: int, max_rectangle_count: int) -> None:
+        """Long lived IDBS processes for running many searches one after another. The processes, the events
+        and the shared incumbent are created once and reset between the runs, so a run doesn't pay for the
+        process startup. A run returns only after all the processes have stopped searching, so no process
+        of a finished run takes CPU time from the next one."""
+        self.processes = processes
+        self.max_rectangle_count = max_rectangle_count
+        self.quit = multiprocessing.Event()
+        self.found = multiprocessing.Event()
+        self.done = multiprocessing.Queue()
+        self.incumbent = SharedIncumbent(max_rectangle_count)
+        self.instances = set()
+        # Bin width of the started search to decode its solution with
+        self.bin_width = None
+        # Each process has its own job queue so every process gets exactly one job of a run
+        self.job_queues = [multiprocessing.Queue() for _ in range(processes)]
+        self.workers = [
+            multiprocessing.Process(
+                target=search_worker,
+                args=(k, jobs, self.done, self.quit, self.found, self.incumbent),
+            )
+            for k, jobs in enumerate(self.job_queues)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def add_instance(self, key, rectangles):
+        """Sends the rectangles of an instance to the processes once. Runs refer to the instance by its key."""
+        if key in self.instances:
+            return
+        for jobs in self.job_queues:
+            jobs.put(("instance", key, rectangles))
+        self.instances.add(key)
+
+    def remove_instance(self, key):
+        """Makes the processes forget the rectangles of an instance which won't be run again. Jobs of a process
+        are done in order, so a started run on the instance finishes before the instance is removed."""
+        if key not in self.instances:
+            return
+        for jobs in self.job_queues:
+            jobs.put(("remove_instance", key))
+        self.instances.discard(key)
+
+    def start(self, key, bin_width, bin_height, time_limit=100, portfolio=None, **idbs_args):
+        """Starts a search on an added instance with all the processes and returns without waiting for it.
+        Portfolio is a list of assignments, one for each process. Extra keyword arguments are given to IDBS.
+        Use finished to check if the search has stopped and result to get its solution. Raises TypeError if the
+        arguments can't be sent to the processes, e.g. a trace with a callback which can't be pickled."""
+        jobs = []
+        for k in range(self.processes):
+            assignment = portfolio[k] if portfolio is not None else None
+            job = ("run", key, bin_width, bin_height, dict(idbs_args, time_limit=time_limit), assignment)
+            # The feeder thread of a queue drops a job it can't pickle, so check it here to not wait forever
+            try:
+                multiprocessing.reduction.ForkingPickler.dumps(job)
+            except Exception as error:
+                raise TypeError(f"search arguments can't be sent to the processes: {error}") from error
+            jobs.append(job)
+        self.quit.clear()
+        self.found.clear()
+        self.incumbent.reset()
+        self.bin_width = bin_width
+        for job_queue, job in zip(self.job_queues, jobs):
+            job_queue.put(job)
+
+    def dead_workers(self):
+        """Returns the ids of the processes which are no longer running, e.g. killed by the system."""
+        return {k for k, worker in enumerate(self.workers) if not worker.is_alive()}
+
+    def finished(self):
+        """Returns True if the started search has finished, either by itself, after cancel or because a
+        process died."""
+        return self.found.is_set() or bool(self.dead_workers())
+
+    def cancel(self):
+        """Stops the started search. The processes stop at the next step of their heuristic and the best
+        solution found so far is still returned by result."""
+        self.quit.set()
+
+    def result(self):
+        """Waits for the started search and returns the best solution as (EncodedSolution, height, id of the
+        process which found it), or None if the search was cancelled before any solution was found. The solution
+        is read from the incumbent after all the processes have stopped, since a process can still offer a better
+        solution until it notices the quit event. A process which died doesn't keep the result waiting."""
+        while not self.found.wait(POLL_INTERVAL):
+            if self.dead_workers():
+                break
+        self.quit.set()
+        # Wait for the other processes to notice the quit event
+        running = set(range(self.processes))
+        while running:
+            try:
+                running.discard(self.done.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                running -= self.dead_workers()
+        return self.incumbent.result(self.bin_width)
+
+    def run(self, key, bin_width, bin_height, time_limit=100, portfolio=None, **idbs_args):
+        """Runs the search on an added instance with all the processes and returns the best solution. A run
+        returns only after all the processes have stopped searching, see start for the arguments."""
+        self.start(key, bin_width, bin_height, time_limit, portfolio, **idbs_args)
+        return self.result()
+
+    def close(self):
+        """Stops the processes. Running searches are cancelled first."""
+        self.quit.set()
+        for jobs in self.job_queues:
+            jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
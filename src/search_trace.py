@@ -0,0 +1,54 @@
+import json
+import math
+import os
+import time
+
+
+class SearchTrace:
+    def __init__(self, path: str = None, callback=None) -> None:
+        """Event stream of the search. Each event is a dict with the event name, the id of the process, the
+        time since the trace is created and the fields of the event. Events are appended to the JSONL file at
+        path and/or given to the callback. The callback is called in the process which emits the event. A trace
+        given to a SearchPool is pickled and sent to each process, so its callback must be picklable, e.g. a module
+        level function, and can't be a bound method of a queue or other object which is only shared by inheritance.
+        All processes can write to the same file: it is opened in append mode in each process and
+        each event is written with a single write, so the lines of different processes don't mix."""
+        self.path = path
+        self.callback = callback
+        self.worker_id = -1
+        self.t0 = time.time()
+        self.file = None
+        # Process which opened the file, a forked process opens its own one
+        self.pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["file"] = None
+        state["pid"] = None
+        return state
+
+    def emit(self, event, **fields):
+        """Records an event. Infinite values are written as null."""
+        record = {"event": event, "worker": self.worker_id, "time": round(time.time() - self.t0, 6)}
+        for name, value in fields.items():
+            record[name] = None if isinstance(value, float) and math.isinf(value) else value
+        if self.callback is not None:
+            self.callback(record)
+        if self.path is not None:
+            if self.pid != os.getpid():
+                self.file = open(self.path, "a", buffering=1)
+                self.pid = os.getpid()
+            self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        """Closes the file of this process."""
+        if self.file is not None and self.pid == os.getpid():
+            self.file.close()
+        self.file = None
+        self.pid = None
+
+
+def read_trace(path):
+    """Returns the events of a JSONL trace file."""
+    with open(path, "r") as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
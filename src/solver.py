@@ -0,0 +1,132 @@
+import math
+import time
+
+from heuristic import Rectangle
+from portfolio import create_portfolio
+from search_pool import SearchPool
+
+# Seconds between the checks of a running search for better solutions
+POLL_INTERVAL = 0.05
+
+
+class Improvement:
+    def __init__(self, height, elapsed, solution) -> None:
+        """A better solution found during a search, given to the improvement callback. Solution is a Solution
+        of the rectangles, elapsed is the seconds since the search started."""
+        self.height = height
+        self.elapsed = elapsed
+        self.solution = solution
+
+
+class SolveResult:
+    def __init__(self, solution, height, target_height, elapsed, worker_id, stopped, improvements) -> None:
+        """Result of solve. Solution is a Solution of the rectangles or None if no solution was found.
+        Stopped is True if the callback stopped the search. Improvements are the (elapsed, height) pairs of
+        the better solutions in the order they were found."""
+        self.solution = solution
+        self.height = height
+        self.target_height = target_height
+        self.elapsed = elapsed
+        # Id of the process which found the solution, -1 if unknown
+        self.worker_id = worker_id
+        self.stopped = stopped
+        self.improvements = improvements
+
+    @property
+    def optimal(self):
+        """True if the solution reaches the target height."""
+        return self.height is not None and self.height == self.target_height
+
+
+def lower_bound(rectangles, bin_width):
+    """Height that no solution can be lower than: the area bound and the shorter side of each rectangle, since the
+    rectangles can be rotated."""
+    area = sum(rectangle.width * rectangle.height for rectangle in rectangles)
+    return max(math.ceil(area / bin_width), max(min(rectangle.width, rectangle.height) for rectangle in rectangles))
+
+
+def solve(
+    rectangles,
+    bin_width,
+    time_limit,
+    height=None,
+    on_improvement=None,
+    processes=1,
+    portfolio=True,
+    pool=None,
+    tabu_seq_length=10,
+    tabu_tenure_multiplier=3,
+    **idbs_args,
+):
+    """Packs the rectangles into a strip of the given width with IDBS and returns a SolveResult.
+    Rectangles are Rectangle objects or (width, height) pairs. Height is the target height of the search,
+    which is the lower bound of the instance if not given. The search stops when a solution reaches the target
+    height or the time_limit seconds pass.
+    on_improvement is called with an Improvement each time a lower solution is found. If it returns True the
+    search is stopped and the best solution so far is returned, so a caller can stop once a solution is good
+    enough. A SearchPool can be given to reuse its processes across calls, otherwise a pool of the given
+    number of processes is started and closed for this call. Extra keyword arguments are given to IDBS."""
+    rectangles = [
+        rectangle if isinstance(rectangle, Rectangle) else Rectangle(rectangle[0], rectangle[1], k)
+        for k, rectangle in enumerate(rectangles)
+    ]
+    target_height = height if height is not None else lower_bound(rectangles, bin_width)
+    own_pool = pool is None
+    if own_pool:
+        pool = SearchPool(processes, len(rectangles))
+    elif pool.max_rectangle_count < len(rectangles):
+        raise ValueError(f"the pool is for up to {pool.max_rectangle_count} rectangles, got {len(rectangles)}")
+    key = ("solve", id(rectangles), time.time())
+    improvements = []
+    stopped = False
+    try:
+        pool.add_instance(key, rectangles)
+        assignments = (
+            create_portfolio(pool.processes, tabu_seq_length, tabu_tenure_multiplier) if portfolio else None
+        )
+        t0 = time.time()
+        deadline = t0 + time_limit
+        pool.start(
+            key,
+            bin_width,
+            target_height,
+            time_limit,
+            assignments,
+            tabu_seq_length=tabu_seq_length,
+            tabu_tenure_multiplier=tabu_tenure_multiplier,
+            **idbs_args,
+        )
+        best_height = None
+        while not pool.finished():
+            if time.time() >= deadline:
+                pool.cancel()
+                break
+            shared_height = pool.incumbent.best_height()
+            if shared_height is not None and (best_height is None or shared_height < best_height):
+                best_height = shared_height
+                improvements.append((time.time() - t0, shared_height))
+                if on_improvement is not None:
+                    solution = pool.incumbent.best_solution(bin_width).materialise(rectangles)
+                    if on_improvement(Improvement(shared_height, time.time() - t0, solution)):
+                        stopped = True
+                        pool.cancel()
+                        break
+            time.sleep(POLL_INTERVAL)
+        best_seq = pool.result()
+        elapsed = time.time() - t0
+    finally:
+        if own_pool:
+            pool.close()
+        else:
+            # Each call adds its rectangles under a new key, so a reused pool would keep all of them otherwise
+            pool.remove_instance(key)
+    if best_seq is None:
+        return SolveResult(None, None, target_height, elapsed, -1, stopped, improvements)
+    encoded_solution, height, worker_id = best_seq
+    solution = encoded_solution.materialise(rectangles)
+    # The last solution can be found after the last check
+    if best_height is None or height < best_height:
+        improvements.append((elapsed, height))
+        if on_improvement is not None:
+            on_improvement(Improvement(height, elapsed, solution))
+    return SolveResult(solution, height, target_height, elapsed, worker_id, stopped, improvements)
@@ -1,38 +1,126 @@
 import math
 import random
+import time
 
-from heuristic import Heuristic
+from array import array
+
+from evaluation_cache import EvaluationCache
+from heuristic import EncodedSolution, Heuristic, RunCheckpoints
+from neighbour_pool import NeighbourPool
+from profiling import HeuristicProfile, profiled_class
+
+# Upper limit for the number of states saved for a heuristic run
+MAX_CHECKPOINTS = 32
+# Upper limit for the attempts to find a pair that is not in the tabu list
+MAX_SWAP_ATTEMPTS = 100
+# Number of initial sequences and max spread values. Each pair of them is a start point for the search
+INITIAL_SEQUENCE_COUNT = 6
+SPREAD_VALUE_COUNT = 4
 
 class GeneratedSequence:
-    def __init__(self, sequence: list, swapped_elements: tuple) -> None:
+    def __init__(self, sequence: list, swapped_elements: tuple, swapped_positions: tuple = None) -> None:
         """Sequence generated by swapping two items from the origin sequence."""
         self.sequence = sequence
         self.swapped_elements = swapped_elements
+        # Indices of the swapped items in the origin sequence
+        self.swapped_positions = swapped_positions
 
 
-class TabuListElement:
-    def __init__(self, swapped_elements, iter_duration) -> None:
-        """Two elements elements which generated a new sequence and how long they will stay in the tabu list."""
-        self.swapped_elements = swapped_elements
-        self.iter_duration = iter_duration
+class TabuList:
+    def __init__(self) -> None:
+        """Pairs of swapped rectangles which are not allowed to be swapped again until they expire.
+        A pair is stored in both orders under the same key. Each pair's expiry iteration is kept in a
+        dictionary and the pairs expiring at the same iteration are kept in the same bucket, so adding,
+        checking and expiring the pairs doesn't depend on the length of the list."""
+        self.iteration = 0
+        self.expiries = {}
+        self.buckets = {}
+
+    @staticmethod
+    def key(pair: tuple):
+        """Same key for a pair in both orders."""
+        first, second = pair
+        return pair if id(first) <= id(second) else (second, first)
+
+    def __contains__(self, pair: tuple):
+        return self.key(pair) in self.expiries
+
+    def __len__(self):
+        return len(self.expiries)
+
+    def add(self, pair: tuple, tenure: int):
+        """Adds the pair to stay in the list for the tenure iterations."""
+        key = self.key(pair)
+        expiry = self.iteration + tenure
+        self.expiries[key] = expiry
+        self.buckets.setdefault(expiry, []).append(key)
+
+    def advance(self):
+        """Moves to the next iteration and removes the pairs expiring at this iteration."""
+        self.iteration += 1
+        for key in self.buckets.pop(self.iteration, ()):
+            if self.expiries.get(key) == self.iteration:
+                del self.expiries[key]
+
 
-    def reduce_duration(self):
-        """Reduce the tabu list duration for the element."""
-        if self.iter_duration > 0:
-            self.iter_duration -= 1
+class Deadline:
+    def __init__(self, deadline: float, quit=None) -> None:
+        """Stop condition which is set once the quit event is set or the wall clock time reaches the deadline.
+        It has the is_set method of an event, so it is given to the heuristic runs as their quit event."""
+        self.deadline = deadline
+        self.quit = quit
+
+    def is_set(self):
+        return time.time() >= self.deadline or (self.quit is not None and self.quit.is_set())
 
 
 class TabuSearchSolver:
-    def __init__(self, non_tabu_seq_length, tabu_tenure_multiplier) -> None:
+    def __init__(
+        self,
+        non_tabu_seq_length,
+        tabu_tenure_multiplier,
+        checkpoint_interval=4,
+        workers=0,
+        prune=True,
+        cache_size=50000,
+        seed=None,
+        profile=False,
+    ) -> None:
         self.seq_length = non_tabu_seq_length
         self.tabu_duration = tabu_tenure_multiplier
-        self.tabu_list = []
+        self.tabu_list = TabuList()
+        # Generated sequences continue from the states saved during the run on their origin sequence.
+        # A state is saved at every checkpoint_interval steps, 0 disables it
+        self.checkpoint_interval = checkpoint_interval
+        # Number of worker processes to evaluate the generated sequences of an iteration in parallel, 0 for no workers
+        self.workers = workers
+        self.pool = None
+        # Stop the heuristic runs on generated sequences once they can't be better than the best one so far
+        self.prune = prune
+        self.heuristic_class = Heuristic
+        # Phase stats of the heuristic runs done in this process, None if profiling is off
+        self.profile = HeuristicProfile() if profile else None
+        if profile:
+            self.heuristic_class = profiled_class(self.heuristic_class, self.profile)
+        # Results of the previous heuristic runs on the same rectangles, up to cache_size results, 0 disables it
+        self.cache = EvaluationCache(cache_size) if cache_size else None
+        self.rectangles = None
+        self.rectangle_ids = {}
+        # Own random generator so the processes can be given different seeds
+        self.random = random.Random(seed)
+        # (initial sequence index, spread value index) pairs to start the search from, None for all of them
+        self.start_points = None
+        # SearchTrace to record the iterations into, None for no trace
+        self.trace = None
+        # Tabu iterations done and the minimum wasted space found in the last run
+        self.iterations = 0
+        self.best_wasted_space = float("inf")
 
     def find_spread_values(self, bin_height, max_height):
         """Generates 4 max spread values to use in the heuristic"""
         spreads = []
-        for i in range(4):
-            spreads.append(max_height + bin_height * i / 3.0)
+        for i in range(SPREAD_VALUE_COUNT):
+            spreads.append(max_height + bin_height * i / (SPREAD_VALUE_COUNT - 1))
         return spreads
 
     def find_sequences(self, rectangles):
@@ -66,13 +154,7 @@ class TabuSearchSolver:
 
     def is_in_tabu_list(self, pair: tuple):
         """Checks if a candidate swap couple is in the tabu list."""
-        for tabu in self.tabu_list:
-            if (
-                pair == tabu.swapped_elements
-                or (pair[1], pair[0]) == tabu.swapped_elements
-            ):
-                return True
-        return False
+        return pair in self.tabu_list
 
     def generate_non_tabu_sequences(self, sequence: list):
         """Generates new sequences by swapping two elements in the given sequence
@@ -81,50 +163,224 @@ class TabuSearchSolver:
         new_sequences = []
         for _ in range(self.seq_length):
             new_sequence = sequence.copy()
-            i, j = random.sample(range(seq_length), 2)
-            while self.is_in_tabu_list((i, j)):
-                i, j = random.sample(range(seq_length), 2)
+            i, j = self.random.sample(range(seq_length), 2)
+            # Small sequences can have all of their pairs in the tabu list, so give up after some attempts
+            attempts = 1
+            while self.is_in_tabu_list((sequence[i], sequence[j])) and attempts < MAX_SWAP_ATTEMPTS:
+                i, j = self.random.sample(range(seq_length), 2)
+                attempts += 1
             new_sequence[i], new_sequence[j] = new_sequence[j], new_sequence[i]
             new_sequences.append(
-                GeneratedSequence(new_sequence, (new_sequence[j], new_sequence[i]))
+                GeneratedSequence(new_sequence, (new_sequence[j], new_sequence[i]), (i, j))
             )
         return new_sequences
 
     def reduce_tabu_list_durations(self):
         """Reduces staying duration for all elements in the tabu list."""
-        for tabu in self.tabu_list:
-            tabu.reduce_duration()
-        self.tabu_list = [tabu for tabu in self.tabu_list if tabu.iter_duration > 0]
+        self.tabu_list.advance()
+
+    def create_checkpoints(self, sequence):
+        """Creates an object to record the states of a heuristic run on the given sequence if checkpoints are enabled."""
+        if not self.checkpoint_interval:
+            return None
+        interval = max(self.checkpoint_interval, math.ceil(len(sequence) / MAX_CHECKPOINTS))
+        return RunCheckpoints(interval)
+
+    def set_rectangles(self, rectangles):
+        """Gives ids to the rectangles to identify the sequences. Cached results are dropped if the rectangles change."""
+        if rectangles is self.rectangles:
+            return
+        self.rectangles = rectangles
+        self.rectangle_ids = {rectangle: k for k, rectangle in enumerate(rectangles)}
+        if self.cache is not None:
+            self.cache.clear()
+
+    def encode_best(self, bin_width, bin_height):
+        """Returns the best sequence of the last successful run as an EncodedSolution."""
+        permutation = array("I", (self.rectangle_ids[rectangle] for rectangle in self.best_seq))
+        return EncodedSolution(permutation, bin_width, bin_height, self.best_spread_value)
+
+    def cache_key(self, sequence, bin_width, bin_height, max_spread):
+        """Returns the key of a heuristic run for the cache or None if there is no cache."""
+        if self.cache is None:
+            return None
+        permutation = array("I", (self.rectangle_ids[rectangle] for rectangle in sequence))
+        return self.cache.key(permutation.tobytes(), bin_width, bin_height, max_spread)
+
+    def cached_result(self, key, waste_cutoff=None):
+        """Returns the (success, wasted space) result of a run from the cache or None if the run should be done.
+        A pruned result is only used if the run would be pruned by the given cutoff too."""
+        if key is None:
+            return None
+        result = self.cache.get(key)
+        if result is None:
+            return None
+        success, wasted_space, pruned = result
+        if not pruned:
+            return success, wasted_space
+        if self.prune and waste_cutoff is not None and wasted_space > waste_cutoff:
+            return False, float("inf")
+        return None
+
+    def store_result(self, key, heuristic, success, quit=None):
+        """Stores the result of a finished heuristic run in the cache."""
+        if key is None or (quit and quit.is_set()):
+            return
+        self.cache.put(key, success, heuristic.wasted_space, heuristic.pruned)
+
+    def run_origin(self, heuristic, sequence, bin_width, bin_height, max_spread, quit=None):
+        """Runs the heuristic on a sequence that new sequences will be generated from. Returns if the run was
+        successful and the checkpoints recorded during the run. If checkpoints are disabled, the run is skipped
+        when the cache already knows that it fails."""
+        key = self.cache_key(sequence, bin_width, bin_height, max_spread)
+        checkpoints = self.create_checkpoints(sequence)
+        if checkpoints is None:
+            cached = self.cached_result(key)
+            if cached is not None and not cached[0]:
+                return False, None
+        heuristic.setup(sequence, bin_width, bin_height, max_spread)
+        success = heuristic.run(quit, checkpoints)
+        self.store_result(key, heuristic, success, quit)
+        return success, checkpoints
+
+    def evaluate(
+        self,
+        heuristic,
+        generated_sequence,
+        bin_width,
+        bin_height,
+        max_spread,
+        quit=None,
+        checkpoints=None,
+        waste_cutoff=None,
+    ):
+        """Runs the heuristic on a generated sequence. Returns if the run was successful and the wasted space.
+        If the checkpoints of the origin sequence are given, the run continues from the last state before
+        the first step where the swap changes the placement. If the run is pruned by the waste cutoff
+        its wasted space is returned as infinite. Results in the cache are returned without running."""
+        step = None
+        if checkpoints is not None and generated_sequence.swapped_positions is not None:
+            step = checkpoints.divergence_step(*generated_sequence.swapped_positions)
+            if step is None and not checkpoints.success:
+                # Places the same rectangles as the origin sequence and fails at the same step
+                return False, checkpoints.wasted_space
+        key = self.cache_key(generated_sequence.sequence, bin_width, bin_height, max_spread)
+        cached = self.cached_result(key, waste_cutoff)
+        if cached is not None:
+            return cached
+        heuristic.setup(generated_sequence.sequence, bin_width, bin_height, max_spread)
+        if step is not None:
+            heuristic.restore(checkpoints.state_before(step))
+        success = heuristic.run(quit, waste_cutoff=waste_cutoff if self.prune else None)
+        self.store_result(key, heuristic, success, quit)
+        if heuristic.pruned:
+            return False, float("inf")
+        return success, heuristic.wasted_space
+
+    def start_pool(self, rectangles):
+        """Starts the worker pool for the rectangles if workers are enabled. A running pool is reused
+        as long as the rectangles are the same."""
+        if not self.workers or (self.pool is not None and self.pool.rectangles is rectangles):
+            return
+        self.close()
+        self.pool = NeighbourPool(self.workers, rectangles, self.heuristic_class, self.prune)
+
+    def close(self):
+        """Stops the worker pool if there is one."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def evaluate_in_pool(self, bin_width, bin_height, max_spread, sequences, checkpoints=None, quit=None):
+        """Evaluates the generated sequences on the worker pool. Returns (success, wasted space) tuples
+        in the order of the sequences, None for the sequences cancelled after a success or by the quit event."""
+        results = [None] * len(sequences)
+        keys = [None] * len(sequences)
+        pending = []
+        for k, generated_sequence in enumerate(sequences):
+            # Results of the sequences placing the same rectangles as their failed origin are already known
+            if (
+                checkpoints is not None
+                and not checkpoints.success
+                and generated_sequence.swapped_positions is not None
+                and checkpoints.divergence_step(*generated_sequence.swapped_positions) is None
+            ):
+                results[k] = (False, checkpoints.wasted_space)
+                continue
+            keys[k] = self.cache_key(generated_sequence.sequence, bin_width, bin_height, max_spread)
+            results[k] = self.cached_result(keys[k])
+            if results[k] is None:
+                pending.append(k)
+        known_wasted_spaces = [result[1] for result in results if result is not None]
+        pool_results = self.pool.evaluate(
+            [sequences[k].sequence for k in pending],
+            bin_width,
+            bin_height,
+            max_spread,
+            min(known_wasted_spaces, default=float("inf")),
+            quit,
+        )
+        for k, result in zip(pending, pool_results):
+            results[k] = result
+            # Pruned results are infinite and cancelled ones are None, only the complete runs are cached
+            if keys[k] is not None and result is not None and result[1] != float("inf"):
+                self.cache.put(keys[k], result[0], result[1], False)
+        return results
 
     def find_seq_with_highest_area_util(
-        self, heuristic, bin_width, bin_height, max_spread, sequences, quit=None
+        self, heuristic, bin_width, bin_height, max_spread, sequences, quit=None, checkpoints=None
     ):
         """Finds the sequence with the minimum wasted space in the generated sequences
          by running the heuristic on the each sequence."""
-        min_wasted_space = float("inf")
-        best_sequence = None
-        for generated_sequence in sequences:
-            # Multiprocessing event to inform another daemon found a solution. So terminate
+        if self.pool is not None:
             if quit and quit.is_set():
                 return None
-            heuristic.setup(generated_sequence.sequence, bin_width, bin_height, max_spread)
-            if heuristic.run(quit):
+            results = self.evaluate_in_pool(bin_width, bin_height, max_spread, sequences, checkpoints, quit)
+        else:
+            results = None
+        min_wasted_space = float("inf")
+        best_sequence = None
+        for k, generated_sequence in enumerate(sequences):
+            if results is not None:
+                # Cancelled after another sequence was successful
+                if results[k] is None:
+                    continue
+                success, wasted_space = results[k]
+            else:
+                # Multiprocessing event to inform another daemon found a solution. So terminate
+                if quit and quit.is_set():
+                    return None
+                success, wasted_space = self.evaluate(
+                    heuristic, generated_sequence, bin_width, bin_height, max_spread, quit, checkpoints, min_wasted_space
+                )
+            if success:
                 self.best_seq = generated_sequence.sequence
                 self.best_spread_value = max_spread
+                self.best_wasted_space = 0
                 return generated_sequence
-            if heuristic.wasted_space < min_wasted_space:
+            if wasted_space < min_wasted_space:
                 best_sequence = generated_sequence
-                min_wasted_space = heuristic.wasted_space
+                min_wasted_space = wasted_space
+        # Cancelled while the sequences were evaluated, so the results are incomplete
+        if quit and quit.is_set():
+            return None
         self.best_seq = best_sequence.sequence
         self.best_spread_value = max_spread
+        self.best_wasted_space = min(self.best_wasted_space, min_wasted_space)
         return best_sequence
 
-    def run(self, rectangles, bin_width, bin_height, iter, quit=None):
-        """Runs the tabu search object with the given rectangle sequence and parameters."""
+    def run(self, rectangles, bin_width, bin_height, iter, quit=None, deadline=None):
+        """Runs the tabu search object with the given rectangle sequence and parameters. If a deadline is given
+        as a time.time() value, the search stops when it is reached like it stops when the quit event is set."""
+        if deadline is not None:
+            # Checked wherever the quit event is, down to each step of the heuristic runs
+            quit = Deadline(deadline, quit)
         # Reset the tabu list
-        self.tabu_list = []
+        self.tabu_list = TabuList()
+        self.iterations = 0
+        self.best_wasted_space = float("inf")
         # Found the duration for how long an item will stay in the tabu list
-        self.tabu_duration *= len(rectangles)
+        tabu_tenure = self.tabu_duration * len(rectangles)
         # Find the rectangle with the maximum height or width since we're allowing for 90 degree rotation
         rec = max(rectangles, key=lambda x: max(x.height, x.width))
         max_height = max(rec.width, rec.height)
@@ -132,42 +388,66 @@ class TabuSearchSolver:
         spread_values = self.find_spread_values(bin_height, max_height)
         # Generate initial sequences
         sequences = self.find_sequences(rectangles)
-        heuristic = Heuristic()
-        # For each initial sequence
-        for sequence in sequences:
-            # For each spread value
-            for spread_value in spread_values:
-                # Run the heuristic on the initial sequence
-                heuristic.setup(sequence, bin_width, bin_height, spread_value)
-                if heuristic.run(quit):
-                    # If the heuristic could place the sequence into the given height. PERFECT! return it
-                    self.best_seq = sequence
+        self.set_rectangles(rectangles)
+        self.start_pool(rectangles)
+        heuristic = self.heuristic_class()
+        start_points = self.start_points
+        if start_points is None:
+            start_points = [(k, p) for k in range(len(sequences)) for p in range(len(spread_values))]
+        sequence_index = None
+        # For each initial sequence and spread value
+        for k, p in start_points:
+            # Start points with the same initial sequence continue from the last best sequence
+            if k != sequence_index:
+                sequence_index = k
+                sequence = sequences[k]
+            spread_value = spread_values[p]
+            # Run the heuristic on the initial sequence
+            success, checkpoints = self.run_origin(heuristic, sequence, bin_width, bin_height, spread_value, quit)
+            if success:
+                # If the heuristic could place the sequence into the given height. PERFECT! return it
+                self.best_seq = sequence
+                self.best_spread_value = spread_value
+                self.best_wasted_space = 0
+                return True
+            for iteration in range(iter):
+                # Generate new sequences from the previous best sequence (first from the inital sequence)
+                new_sequences = self.generate_non_tabu_sequences(sequence)
+                # Check for multiprocessing event before start calculating
+                if quit and quit.is_set():
+                    return False
+                # Find the best sequence by the highest area utilization (minimum wasted space)
+                best_sequence = self.find_seq_with_highest_area_util(
+                    heuristic, bin_width, bin_height, spread_value, new_sequences, quit, checkpoints
+                )
+                # Cancelled while the neighbours were evaluated
+                if best_sequence is None:
+                    return False
+                # The best sequence will be the origin of the next generated sequences, record its run
+                success, checkpoints = self.run_origin(
+                    heuristic, best_sequence.sequence, bin_width, bin_height, spread_value, quit
+                )
+                self.iterations += 1
+                if self.trace is not None:
+                    self.trace.emit(
+                        "tabu_iteration",
+                        height=bin_height,
+                        start_point=[k, p],
+                        iteration=iteration,
+                        wasted_space=self.best_wasted_space,
+                        success=success,
+                    )
+                # If the heuristic can fit the best sequence into the given height. PERFECT! return it
+                if success:
+                    self.best_seq = best_sequence.sequence
                     self.best_spread_value = spread_value
                     return True
-                for _ in range(iter):
-                    # Generate new sequences from the previous best sequence (first from the inital sequence)
-                    new_sequences = self.generate_non_tabu_sequences(sequence)
-                    # Check for multiprocessing event before start calculating
-                    if quit and quit.is_set():
-                        return False
-                    # Find the best sequence by the highest area utilization (minimum wasted space)
-                    best_sequence = self.find_seq_with_highest_area_util(
-                        heuristic, bin_width, bin_height, spread_value, new_sequences
-                    )
-                    heuristic.setup(
-                        best_sequence.sequence, bin_width, bin_height, spread_value
-                    )
-                    # If the heuristic can fit the best sequence into the given height. PERFECT! return it
-                    if heuristic.run(quit):
-                        self.best_seq = best_sequence.sequence
-                        self.best_spread_value = spread_value
-                        return True
-                    # Reduce durations for elements inside the tabu list
-                    self.reduce_tabu_list_durations()
-                    # Add the two elements that is used while generating the best sequence to the tabu list
-                    if not self.is_in_tabu_list(best_sequence.swapped_elements):
-                        self.tabu_list.append(TabuListElement(best_sequence.swapped_elements, self.tabu_duration))
-                    # Change the sequence that will be used on the next iteration to the best sequence found in this iteration
-                    sequence = best_sequence.sequence
+                # Reduce durations for elements inside the tabu list
+                self.reduce_tabu_list_durations()
+                # Add the two elements that is used while generating the best sequence to the tabu list
+                if not self.is_in_tabu_list(best_sequence.swapped_elements):
+                    self.tabu_list.add(best_sequence.swapped_elements, tabu_tenure)
+                # Change the sequence that will be used on the next iteration to the best sequence found in this iteration
+                sequence = best_sequence.sequence
         # Return false if we couldn't place any sequence into the given height during our search
         return False
\ No newline at end of file
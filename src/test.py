@@ -2,53 +2,44 @@ import multiprocessing
 import os
 import time
 
-from idbs import IDBS
-from heuristic import Rectangle
+from instances import DATA_DIR, find_instance_files, read_rectangles_from_file
+from portfolio import create_portfolio
+from search_pool import SearchPool
+from search_trace import SearchTrace
 
-ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
-DATA_DIR = os.path.join(ROOT_DIR, "data")
 RUN_PER_TEST = 10
+# Give each process a different part of the search instead of running the same search on all of them
+PORTFOLIO = True
+# JSONL file to record the search events of all the processes into, None for no trace
+TRACE_PATH = None
 
-def run(rectangles, bin_width, bin_height):
-    quit = multiprocessing.Event()
-    found = multiprocessing.Event()
-    return_queue = multiprocessing.Queue()
-    processes = []
-    idbs = IDBS(100, bin_width, bin_height)
-    for _ in range(multiprocessing.cpu_count() // 2):
-        p = multiprocessing.Process(
-            target=idbs.run, args=(rectangles, quit, found, return_queue)
-        )
-        processes.append(p)
-        p.start()
-    found.wait()
-    quit.set()
-    return return_queue.get()
-
-def read_rectangles_from_file(file_path):
-    rectangles = []
-    with open(file_path, "r") as dataset:
-        rectangle_count = int(dataset.readline())
-        bin_width, bin_height = map(int, dataset.readline().split(" "))
-        x = 0
-        for i in range(rectangle_count):
-            rec_width, rec_height = map(int, dataset.readline().split(" ")[:2])
-            rectangle = Rectangle(rec_width, rec_height)
-            rectangles.append(rectangle)
-    return (rectangles, bin_width, bin_height)
+def run(pool, filename, bin_width, bin_height):
+    portfolio = create_portfolio(pool.processes, 10, 3) if PORTFOLIO else None
+    trace = SearchTrace(TRACE_PATH) if TRACE_PATH else None
+    best_seq = pool.run(filename, bin_width, bin_height, 100, portfolio, trace=trace)
+    if PORTFOLIO and best_seq and best_seq[2] >= 0:
+        print(f"Found by: {portfolio[best_seq[2]].describe()}")
+    return best_seq
 
 if __name__ == "__main__":
-    for filename in sorted(os.listdir(DATA_DIR)):
-        path_to_file = os.path.join(DATA_DIR, filename)
-        if os.path.isfile(path_to_file):
-            rectangles, bin_width, bin_height = read_rectangles_from_file(path_to_file)
+    instances = {}
+    for path_to_file in find_instance_files(DATA_DIR):
+        instances[os.path.basename(path_to_file)] = read_rectangles_from_file(path_to_file)
+    # Processes are started once for all the tests
+    pool = SearchPool(
+        max(multiprocessing.cpu_count() // 2, 1),
+        max((len(rectangles) for rectangles, _, _ in instances.values()), default=0),
+    )
+    try:
+        for filename, (rectangles, bin_width, bin_height) in instances.items():
+            pool.add_instance(filename, rectangles)
             min_run_time = float("inf")
             min_height = float("inf")
             max_run_time = 0.0
             total_run_time = 0
             for _ in range(RUN_PER_TEST):
                 t0 = time.time()
-                best_seq = run(rectangles, bin_width, bin_height)
+                best_seq = run(pool, filename, bin_width, bin_height)
                 run_time = time.time() - t0
                 if run_time < min_run_time:
                     min_run_time = run_time
@@ -62,4 +53,6 @@ if __name__ == "__main__":
             print(f"Min. Height: {min_height}")
             print(f"Min. Run Time: {min_run_time}")
             print(f"Max. Run Time: {max_run_time}")
-            print(f"Avg. Run Time: {avg_run_time}\n\n")
\ No newline at end of file
+            print(f"Avg. Run Time: {avg_run_time}\n\n")
+    finally:
+        pool.close()
@@ -2,28 +2,20 @@ import multiprocessing
 import os
 import tkinter
 import time
-import turtle
 
-from heuristic import Rectangle
-from idbs import IDBS
+import gcode
+from canvas_renderer import CanvasRenderer
+from instances import DATA_DIR, INSTANCE_PATTERN, read_rectangles_from_file
+from portfolio import create_portfolio
+from search_pool import SearchPool
 from tkinter import filedialog
 
-DEF_SERVO_UP = "M03"
-DEF_SERVO_DOWN = "M05"
-DEF_TRAVEL_SPEED = "2000"
-DEF_DRAWING_SPEED = "1000"
-DEF_UP_ANGLE = "30"
-DEF_DOWN_ANGLE = "60"
-DEF_DELAY = "0.2"
-
 DEF_TABU_SEQ_LENGTH = 10
 DEF_TABU_TENURE = 3
-
-ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
-DATA_DIR = os.path.join(ROOT_DIR, "data")
-
-A4_WIDTH = 21.0
-A4_HEIGHT = 29.7
+# Time limit of a search in seconds
+TIME_LIMIT = 100
+# Milliseconds between the checks of a running search
+POLL_INTERVAL = 200
 
 class UI:
     def __init__(self) -> None:
@@ -48,13 +40,20 @@ class UI:
         self.open_file_button.grid(row=2, column=0, columnspan=2, padx=(0, 50))
         # Run button
         self.run_button = tkinter.Button(text="Run", state="disabled", command=self.run)
-        self.run_button.grid(row=50, column=0, columnspan=2, padx=(0, 50))
+        self.run_button.grid(row=50, column=0)
+        # Cancel button to stop a running search
+        self.cancel_button = tkinter.Button(text="Cancel", state="disabled", command=self.cancel)
+        self.cancel_button.grid(row=50, column=1, padx=(0, 50))
         # Save gcode for the solution button
         self.gcode_button = tkinter.Button(text="Save G-code", state="disabled", command=self.save_gcode)
         self.gcode_button.grid(row=50, column=3)
         # Console area to write logs
         self.text_widget = tkinter.Text(wrap="word", height=20, width=50)
-        self.text_widget.grid(row=3, column=0, columnspan=2, rowspan=45, padx=(0, 50))
+        self.text_widget.grid(row=3, column=0, columnspan=2, rowspan=44, padx=(0, 50))
+        # Give each process a different part of the search
+        self.diversify = tkinter.BooleanVar(value=True)
+        self.diversify_check = tkinter.Checkbutton(text="Diversify processes", variable=self.diversify)
+        self.diversify_check.grid(row=47, column=0, columnspan=2, padx=(0, 50))
         
         # Elements for placement height choice
         self.height_choice = tkinter.IntVar()
@@ -65,71 +64,69 @@ class UI:
         self.cust_height_radio.grid(row=49, column=0, sticky="e")
         self.cust_height.grid(row=49, column=1, sticky="w", padx=0)
 
-        # Turtle for drawing
-        self.t = turtle.RawTurtle(canvas=self.canvas, visible=False)
-        # Events to inform other deamons to terminate if one of them finds a solution
-        self.quit = multiprocessing.Event()
-        self.found = multiprocessing.Event()
+        # Fill the rotated rectangles with another colour
+        self.colour_rotated = tkinter.BooleanVar(value=False)
+        self.colour_check = tkinter.Checkbutton(text="Colour rotated rectangles", variable=self.colour_rotated, command=self.redraw)
+        self.colour_check.grid(row=51, column=3)
+        self.renderer = CanvasRenderer(self.canvas)
+        self.drawn_placements = None
+        # Search processes, started on the first run and kept for the next ones
+        self.pool = None
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
 
     def start(self):
         """Starts the UI"""
-        self.window.mainloop()
+        try:
+            self.window.mainloop()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
 
-    def draw_rectangle(self, bottom_left_pos, width, height, scale=1, start_x=0, start_y=0):
-        """Draws a rectangle on UI object's canvas"""
-        self.t.speed(0)
-        self.t.hideturtle()
-        self.t.penup()
-        self.t.goto((bottom_left_pos[0] * scale + start_x, bottom_left_pos[1] * scale + start_y))
-        self.t.pendown()
-        self.t.forward(width * scale)
-        self.t.left(90)
-        self.t.forward(height * scale)
-        self.t.left(90)
-        self.t.forward(width * scale)
-        self.t.left(90)
-        self.t.forward(height * scale)
-        self.t.left(90)
+    def close(self):
+        """Stops the search processes and closes the window."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        self.window.destroy()
 
+    def log(self, message):
+        """Writes a line to the console area."""
+        self.text_widget.config(state="normal")
+        self.text_widget.insert(tkinter.END, f"{message}\n")
+        self.text_widget.see(tkinter.END)
+        self.text_widget.config(state="disabled")
 
-    def draw_sequence(self, sequence: list[Rectangle], scale=1, start_x=0, start_y=0):
-        """Draws a list of rectangles on UI object's canvas."""
-        # Disable all the buttons while drawing
-        self.open_file_button.config(state="disabled")
-        self.run_button.config(state="disabled")
-        self.gcode_button.config(state="disabled")
-        # Clear the previous drawing
-        self.t.reset()
+    def draw_sequence(self, placements: list):
+        """Draws a list of (rectangle, bottom left position, rotate) placements on UI object's canvas."""
+        self.drawn_placements = placements
+        self.renderer.draw(placements, self.bin_width, self.bin_height, self.colour_rotated.get())
+
+    def redraw(self):
+        """Draws the last solution again, e.g. after a drawing option is changed."""
+        if self.drawn_placements is not None:
+            self.draw_sequence(self.drawn_placements)
 
-        for rectangle in sequence:
-            if rectangle.bottom_left_pos:
-                width = rectangle.height if rectangle.rotate else rectangle.width
-                height = rectangle.width if rectangle.rotate else rectangle.height
-                self.draw_rectangle(rectangle.bottom_left_pos, width, height, scale, start_x, start_y)
-        # Activate the buttons back
-        self.open_file_button.config(state="active")
-        self.run_button.config(state="active")
-    
     def open_test_file(self):
         """Opens a dialog box for user to pick a Hopper-Turton's C test file to load."""
-        file_path = filedialog.askopenfilename(initialdir=DATA_DIR, title="Select a file", filetypes=[("All files", "C*_*")])
+        file_path = filedialog.askopenfilename(initialdir=DATA_DIR, title="Select a file", filetypes=[("All files", INSTANCE_PATTERN)])
         if file_path:
-            self.rectangles = []
+            self.instance_key = file_path
+            # Clear the solution of the previous file
+            self.drawn_placements = None
+            self.renderer.clear()
+            self.gcode_button.config(state="disabled")
             # Read bin width, bin height and rectangles from the test file
-            with open(file_path, "r") as dataset:
-                self.text_widget.config(state="normal")
-                self.text_widget.delete(1.0, tkinter.END)  # Clear previous content
-                rectangle_count = int(dataset.readline())
-                self.bin_width, self.bin_height = map(int, dataset.readline().split(" "))
-                self.opt_height = self.bin_height
-                for i in range(rectangle_count):
-                    rec_width, rec_height = map(int, dataset.readline().split(" ")[:2])
-                    # Log each rectangle to the console
-                    self.text_widget.insert(
-                        tkinter.END, f"{i + 1:<4}- width: {rec_width:<3} | height: {rec_height}\n"
-                    )
-                    rectangle = Rectangle(rec_width, rec_height)
-                    self.rectangles.append(rectangle)
+            self.rectangles, self.bin_width, self.bin_height = read_rectangles_from_file(file_path)
+            self.opt_height = self.bin_height
+            rectangle_count = len(self.rectangles)
+            self.text_widget.config(state="normal")
+            self.text_widget.delete(1.0, tkinter.END)  # Clear previous content
+            for i, rectangle in enumerate(self.rectangles):
+                # Log each rectangle to the console
+                self.text_widget.insert(
+                    tkinter.END, f"{i + 1:<4}- width: {rectangle.width:<3} | height: {rectangle.height}\n"
+                )
             # Log the test file informations to the consoe   
             self.text_widget.insert(tkinter.END, f"--------\nFile: {os.path.basename(file_path)}\n")
             self.text_widget.insert(tkinter.END, f"Rectangle count: {rectangle_count}\n")
@@ -147,17 +144,9 @@ class UI:
 
 
     def run(self):
-        """Run's the IDBS(Iterative Doubling Binary Search) for the loaded Hopper-Turton C test file."""
-        # Clear the events for multiprocessing
-        self.quit.clear()
-        self.found.clear()
-        # Make the console area editable
-        self.text_widget.config(state="normal")
-        self.text_widget.insert(tkinter.END, "Running...\n")
-        # Move the cursor to the end of the console
-        self.text_widget.see(tkinter.END)
-        # Queue for daemons to put their solution into
-        return_queue = multiprocessing.Queue()
+        """Starts the IDBS(Iterative Doubling Binary Search) for the loaded Hopper-Turton C test file. The search runs
+        in the search processes while the window stays responsive, poll_search checks it periodically."""
+        self.log("Running...")
         # Get the configuration values from the sliders on the UI
         tabu_seq_length = self.tabu_seq_length_slider.get()
         tabu_tenure = self.tabu_tenure_slider.get()
@@ -166,40 +155,77 @@ class UI:
             self.bin_height = self.opt_height
         else:
             self.bin_height = int(self.cust_height.get())
+        # Half of the core count processes are started once, they are started again only for a larger instance
+        if self.pool is not None and self.pool.max_rectangle_count < len(self.rectangles):
+            self.pool.close()
+            self.pool = None
+        if self.pool is None:
+            self.pool = SearchPool(max(multiprocessing.cpu_count() // 2, 1), len(self.rectangles))
+        self.pool.add_instance(self.instance_key, self.rectangles)
+        if self.diversify.get():
+            self.portfolio = create_portfolio(self.pool.processes, tabu_seq_length, tabu_tenure)
+        else:
+            self.portfolio = None
+        self.open_file_button.config(state="disabled")
+        self.run_button.config(state="disabled")
+        self.gcode_button.config(state="disabled")
+        self.cancel_button.config(state="active")
+        self.cancelled = False
+        self.reported_height = None
         # Set the timer
-        t0 = time.time()
-        # Create an iterative doubling binary search object
-        idbs = IDBS(100, self.bin_width, self.bin_height, tabu_seq_length, tabu_tenure)
-        # Create half of the core count new processes and run
-        for _ in range(multiprocessing.cpu_count() // 2):
-            p = multiprocessing.Process(
-                target=idbs.run, args=(self.rectangles, self.quit, self.found, return_queue)
-            )
-            p.start()
-        # Wait for the found event from one of the processes
-        self.found.wait()
-        # Set the quit event for other events to terminate themselves
-        self.quit.set()
-        # Get the solution from the queue
-        best_seq = return_queue.get()
+        self.t0 = time.time()
+        self.pool.start(
+            self.instance_key,
+            self.bin_width,
+            self.bin_height,
+            TIME_LIMIT,
+            self.portfolio,
+            tabu_seq_length=tabu_seq_length,
+            tabu_tenure_multiplier=tabu_tenure,
+        )
+        self.window.after(POLL_INTERVAL, self.poll_search)
+
+    def cancel(self):
+        """Stops the running search. The best solution found so far is drawn when the processes stop."""
+        self.cancelled = True
+        self.cancel_button.config(state="disabled")
+        self.pool.cancel()
+        self.log("Cancelling...")
+
+    def poll_search(self):
+        """Logs the best height found so far by any of the processes and shows the solution when the search ends."""
+        height = self.pool.incumbent.best_height()
+        if height is not None and height != self.reported_height:
+            self.reported_height = height
+            self.log(f"Best height so far: {height} in {time.time() - self.t0:.2f}s")
+            # Show the better solution while the search goes on, only the moved rectangles are drawn again
+            solution = self.pool.incumbent.best_solution(self.bin_width)
+            if solution is not None:
+                self.draw_sequence(list(solution.materialise(self.rectangles)))
+        if not self.pool.finished():
+            self.window.after(POLL_INTERVAL, self.poll_search)
+            return
+        best_seq = self.pool.result()
+        self.cancel_button.config(state="disabled")
+        self.open_file_button.config(state="active")
+        self.run_button.config(state="active")
+        if best_seq is None:
+            reason = "Cancelled" if self.cancelled else "Time limit reached"
+            self.log(f"{reason} before finding a solution in: {time.time() - self.t0:.2f}s")
+            return
         # Check if the solution is an optimal solution and log it
-        if best_seq[1] == self.opt_height:
-            self.text_widget.insert(tkinter.END, f"An optimal solution found in: {time.time() - t0:.2f}s\n")
+        if self.cancelled:
+            self.log(f"Cancelled with a solution with the height of {best_seq[1]} in: {time.time() - self.t0:.2f}s")
+        elif best_seq[1] == self.opt_height:
+            self.log(f"An optimal solution found in: {time.time() - self.t0:.2f}s")
         else:
-            self.text_widget.insert(tkinter.END, f"A desired solution found with the custom height of {best_seq[1]} in: {time.time() - t0:.2f}s\n")
-        self.text_widget.see(tkinter.END)
-        # Disable the console area
-        self.text_widget.config(state="disabled")
-        self.canvas.update()
-        # Adjust the starting point of the drawing to fit the solution on the canvas
-        scale = self.canvas.winfo_height() / (max(self.bin_width, self.bin_height) * 1.1)
-        start_x = -(self.bin_width * scale) // 2
-        start_y = -(self.bin_height * scale) // 2
-        # Sort the solution by x and y values to draw rectangles from bottom to top
-        best_seq[0].sort(key=lambda x: x.bottom_left_pos[0])
-        best_seq[0].sort(key=lambda x: x.bottom_left_pos[1])
-        self.best_seq = best_seq[0]
-        self.draw_sequence(best_seq[0], scale, start_x, start_y)
+            self.log(f"A desired solution found with the custom height of {best_seq[1]} in: {time.time() - self.t0:.2f}s")
+        if self.portfolio is not None and best_seq[2] >= 0:
+            self.log(f"Found by: {self.portfolio[best_seq[2]].describe()}")
+        # Sort the solution by y and x values to draw rectangles from bottom to top
+        solution = best_seq[0].materialise(self.rectangles)
+        self.best_seq = sorted(solution, key=lambda x: (x[1][1], x[1][0]))
+        self.draw_sequence(self.best_seq)
         self.gcode_button.config(state="active")
 
     def save_gcode(self):
@@ -237,13 +263,13 @@ class UI:
                 self.delay.insert(0, f.readline().rstrip("\n"))
         except FileNotFoundError:
             # Populate with the default values if there is no save file
-            self.up_command.insert(0, DEF_SERVO_UP)
-            self.down_command.insert(0, DEF_SERVO_DOWN)
-            self.travel_speed.insert(0, DEF_TRAVEL_SPEED)
-            self.draw_speed.insert(0, DEF_DRAWING_SPEED)
-            self.up_angle.insert(0, DEF_UP_ANGLE)
-            self.down_angle.insert(0, DEF_DOWN_ANGLE)
-            self.delay.insert(0, DEF_DELAY)
+            self.up_command.insert(0, gcode.DEF_SERVO_UP)
+            self.down_command.insert(0, gcode.DEF_SERVO_DOWN)
+            self.travel_speed.insert(0, gcode.DEF_TRAVEL_SPEED)
+            self.draw_speed.insert(0, gcode.DEF_DRAWING_SPEED)
+            self.up_angle.insert(0, gcode.DEF_UP_ANGLE)
+            self.down_angle.insert(0, gcode.DEF_DOWN_ANGLE)
+            self.delay.insert(0, gcode.DEF_DELAY)
 
         # Place elements on the window
         self.up_command.grid(row=0, column= 1, sticky="e")
@@ -275,53 +301,27 @@ class UI:
         # Ask for the save location
         file_path = filedialog.asksaveasfilename(title="Select a destination", initialfile="servo.gcode", defaultextension=".gcode", filetypes=[("G-Code Files", "*.gcode")])
         if file_path:
-            # Common G-Code commands generated from the settings
-            up_command = f"{self.up_command.get()} S{self.up_angle.get()}\n"
-            down_command = f"{self.down_command.get()} S{self.down_angle.get()}\n"
-            travel_speed = f"G1 F{self.travel_speed.get()}\n"
-            draw_speed = f"G1 F{self.draw_speed.get()}\n"
-            delay = f"G4 P{self.delay.get()}\n"
             # Check if the solution will fit on an A4 paper
-            scale = 1
-            if self.bin_width > A4_WIDTH:
-                # Scale down factor
-                scale = (A4_WIDTH - 1) / self.bin_width
-            elif self.bin_height > A4_HEIGHT:
-                # Scale down factor
-                scale = (A4_HEIGHT - 1) / self.bin_height
-            
+            scale = gcode.paper_scale(self.bin_width, self.bin_height)
+            # Shared and adjacent edges are drawn once and the lines are ordered for a short pen up travel
+            polylines = gcode.plan_polylines(self.best_seq)
             with open(file_path, "w") as f:
-                # First raise the pen and give the settings
-                f.write(f"{up_command}\nG90\nG21\n")
-                # For each rectangle in the solution
-                for rec in self.best_seq:
-                    # Bottom left position of the rectangle
-                    x, y = rec.bottom_left_pos
-                    x, y = (x * scale, y * scale)
-                    # Check if the rectangle is rotated in the solution
-                    width, height = (rec.width, rec.height) if not rec.rotate else (rec.height, rec.width)
-                    width, height = (width * scale, height * scale)
-                    # Set move speed to travel speed since the pen is up
-                    f.write(travel_speed)
-                    # Go to bottom left position of the rectangle
-                    f.write(f"G1 X{x} Y{y}\n")
-                    f.write(delay)
-                    # Lower the pen
-                    f.write(down_command)
-                    f.write(delay)
-                    # Set move speed to drawing speed
-                    f.write(draw_speed)
-                    # Draw each side of the rectangle
-                    f.write(f"G1 X{x + width} Y{y}\n")
-                    f.write(f"G1 X{x + width} Y{y + height}\n")
-                    f.write(f"G1 X{x} Y{y + height}\n")
-                    f.write(f"G1 X{x} Y{y}\n")
-                    f.write(delay)
-                    # Raise the pen
-                    f.write(up_command)
-                    f.write(delay)
-                f.write(travel_speed)
-                # Go to origin at the end
-                f.write(f"G1 X0 Y0")
-                # Close the previously opened new window
-                self.new_window.destroy()
+                gcode.write_gcode(
+                    f,
+                    polylines,
+                    scale,
+                    f"{self.up_command.get()} S{self.up_angle.get()}",
+                    f"{self.down_command.get()} S{self.down_angle.get()}",
+                    self.travel_speed.get(),
+                    self.draw_speed.get(),
+                    self.delay.get(),
+                )
+            try:
+                estimate = gcode.PlotEstimate(
+                    polylines, scale, float(self.travel_speed.get()), float(self.draw_speed.get()), float(self.delay.get())
+                )
+                self.log(f"G-code saved: {estimate}")
+            except (ValueError, ZeroDivisionError):
+                self.log("G-code saved, plot time can't be estimated from the settings")
+            # Close the previously opened new window
+            self.new_window.destroy()
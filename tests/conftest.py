@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the solver are imported by their names from the src directory like the scripts in it do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
@@ -0,0 +1,96 @@
+import os
+import random
+
+from heuristic import Heuristic, Rectangle, RunCheckpoints
+from instances import DATA_DIR, read_rectangles_from_file
+
+
+def rectangles(sizes):
+    return [Rectangle(width, height, k) for k, (width, height) in enumerate(sizes)]
+
+
+def test_waste_cutoff_does_not_prune_a_successful_run():
+    # Wasted space of this run is higher than the free area of the bin, but the run still succeeds
+    sequence = rectangles([(10, 8), (2, 14), (10, 6), (4, 14), (1, 20), (3, 14), (10, 6), (9, 6)])
+    heuristic = Heuristic()
+    heuristic.setup(sequence, 20, 22, 42)
+    assert heuristic.run()
+    assert heuristic.wasted_space > heuristic.free_area
+
+    heuristic.setup(sequence, 20, 22, 42)
+    assert heuristic.run(waste_cutoff=0)
+    assert not heuristic.pruned
+
+
+class CheckedHeuristic(Heuristic):
+    """Heuristic which checks its incremental updates against a recompute over the whole skyline at each step."""
+
+    def find_candidate_points(self):
+        super().find_candidate_points()
+        incremental = point_values(self)
+        self.points_valid = False
+        super().find_candidate_points()
+        assert incremental == point_values(self)
+
+    def merge_unnecessary_segments(self, cur_placement_width):
+        super().merge_unnecessary_segments(cur_placement_width)
+        # A pass over the whole skyline doesn't find anything left to merge
+        segments_to_remove = []
+        for i in range(1, len(self.segments) - 1):
+            self.check_segment_narrow(i, self.merged_width, segments_to_remove)
+            self.check_segment_same_height(i, segments_to_remove)
+        assert segments_to_remove == []
+
+
+def point_values(heuristic):
+    return [
+        (point.x, point.y, point.is_left, point.w_base, point.w_max, point.h_left, point.h_right)
+        for point in (segment.point for segment in heuristic.segments[1:])
+    ]
+
+
+def instance_sequences(name, count, seed=0):
+    rectangles, bin_width, bin_height = read_rectangles_from_file(os.path.join(DATA_DIR, name))
+    generator = random.Random(seed)
+    sequences = [generator.sample(rectangles, len(rectangles)) for _ in range(count)]
+    return sequences, bin_width, bin_height
+
+
+def run_result(heuristic):
+    return heuristic.wasted_space, heuristic.positions, heuristic.step
+
+
+def test_incremental_updates_match_whole_skyline():
+    for name in ("C1_1", "C3_1", "C5_1"):
+        sequences, bin_width, bin_height = instance_sequences(name, 10)
+        heuristic = CheckedHeuristic()
+        for sequence in sequences:
+            heuristic.setup(sequence, bin_width, bin_height + 2, bin_height)
+            heuristic.run()
+
+
+def test_resumed_run_matches_run_from_scratch():
+    heuristic = Heuristic()
+    for name in ("C1_1", "C1_2"):
+        sequences, bin_width, bin_height = instance_sequences(name, 2)
+        for sequence in sequences:
+            checkpoints = RunCheckpoints(2)
+            heuristic.setup(sequence, bin_width, bin_height, bin_height)
+            heuristic.run(checkpoints=checkpoints)
+            origin = run_result(heuristic)
+            for i in range(len(sequence)):
+                for j in range(i + 1, len(sequence)):
+                    swapped = list(sequence)
+                    swapped[i], swapped[j] = swapped[j], swapped[i]
+                    heuristic.setup(swapped, bin_width, bin_height, bin_height)
+                    success = heuristic.run()
+                    expected = run_result(heuristic)
+                    step = checkpoints.divergence_step(i, j)
+                    if step is None:
+                        # Places the same rectangles as the origin sequence
+                        assert expected == origin
+                        continue
+                    heuristic.setup(swapped, bin_width, bin_height, bin_height)
+                    heuristic.restore(checkpoints.state_before(step))
+                    assert heuristic.run() == success
+                    assert run_result(heuristic) == expected
@@ -0,0 +1,27 @@
+import os
+
+from instances import DATA_DIR, read_rectangles_from_file
+from tabu_search import TabuSearchSolver
+
+
+def search_result(solver, name, height_change, start_points):
+    rectangles, bin_width, bin_height = read_rectangles_from_file(os.path.join(DATA_DIR, name))
+    solver.start_points = start_points
+    success = solver.run(rectangles, bin_width, bin_height + height_change, 5)
+    best_seq = [rectangle.id for rectangle in solver.best_seq] if success else None
+    return success, best_seq, solver.iterations, solver.best_wasted_space
+
+
+def test_checkpoints_pruning_and_cache_dont_change_the_search():
+    # The last searches can't succeed below the optimum height, so they compare the wasted space of their neighbours
+    for name, height_change, start_points in (
+        ("C1_1", 0, None),
+        ("C2_1", 1, None),
+        ("C1_3", -1, [(0, 0), (2, 3)]),
+        ("C2_3", -1, [(1, 0), (3, 2)]),
+    ):
+        for seed in (1, 2):
+            plain = TabuSearchSolver(10, 3, checkpoint_interval=0, prune=False, cache_size=0, seed=seed)
+            default = TabuSearchSolver(10, 3, seed=seed)
+            expected = search_result(plain, name, height_change, start_points)
+            assert search_result(default, name, height_change, start_points) == expected